@@ -0,0 +1,188 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import ValidationError
+from django.core.paginator import InvalidPage, Page
+from django.http import Http404
+from django.urls import re_path
+from rest_framework.authtoken.models import Token
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+from api.ingredient_index import ingredient_index
+from api.pagination import LimitPagination
+from users.models import Follow
+
+
+class Unsupported(Exception):
+    """Запрос должен обработать синхронный ViewSet."""
+
+
+async def get_token_user(request):
+    """Пользователь по заголовку Authorization: Token <ключ>, как в
+    TokenAuthentication. Для неверного заголовка или токена возвращает
+    None: ответ 401 формирует синхронный ViewSet.
+    """
+    auth = request.headers.get('Authorization', '').split()
+    if not auth or auth[0].lower() != 'token':
+        return AnonymousUser()
+    if len(auth) != 2:
+        return None
+    try:
+        token = await Token.objects.select_related('user').aget(key=auth[1])
+    except Token.DoesNotExist:
+        return None
+    return token.user if token.user.is_active else None
+
+
+async def load_following_ids(request):
+    """Загружает подписки для FoodUserSerializer.get_following_ids."""
+    following_ids = frozenset()
+    if request.user.is_authenticated:
+        following_ids = frozenset([
+            following_id async for following_id in Follow.objects.filter(
+                user=request.user
+            ).values_list('following_id', flat=True).aiterator()
+        ])
+    request._following_ids = following_ids
+
+
+async def paginate(view, queryset):
+    """Асинхронный вариант LimitPagination.paginate_queryset."""
+    pagination, request = view.paginator, view.request
+    page_size = pagination.get_page_size(request)
+    paginator = pagination.django_paginator_class(queryset, page_size)
+    paginator.count = await queryset.acount()
+    number = request.query_params.get(pagination.page_query_param) or 1
+    if number in pagination.last_page_strings:
+        number = paginator.num_pages
+    try:
+        number = paginator.validate_number(number)
+    except InvalidPage as exc:
+        raise NotFound(pagination.invalid_page_message.format(
+            page_number=number, message=str(exc)))
+    bottom = (number - 1) * page_size
+    # aiterator() в Django 4.2 не поддерживает prefetch_related,
+    # async for выполняет выборку вместе с предзагрузкой.
+    objects = [obj async for obj in queryset[bottom:bottom + page_size]]
+    pagination.page = Page(objects, number, paginator)
+    pagination.request = request
+    return objects
+
+
+async def recipe_list(view, request):
+    if not isinstance(view.paginator, LimitPagination):
+        raise Unsupported
+    queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+    recipes = await paginate(view, queryset)
+    await load_following_ids(request)
+    return view.get_paginated_response(
+        view.get_serializer(recipes, many=True).data)
+
+
+async def recipe_detail(view, request):
+    queryset = await sync_to_async(view.filter_queryset)(view.get_queryset())
+    try:
+        recipe = await queryset.aget(pk=view.kwargs[view.lookup_field])
+    except (queryset.model.DoesNotExist, TypeError, ValueError,
+            ValidationError):
+        raise Http404
+    view.check_object_permissions(request, recipe)
+    await load_following_ids(request)
+    return Response(view.get_serializer(recipe).data)
+
+
+async def ingredient_list(view, request):
+    name = request.query_params.get('name')
+    search = request.query_params.get('search')
+    if not name and not search:
+        raise Unsupported
+    limit = settings.INGREDIENT_SEARCH_LIMIT
+    if name and not search:
+        results = await sync_to_async(ingredient_index.search)(name, limit)
+        if results is not None:
+            return Response(results)
+    queryset = view.filter_queryset(view.get_queryset())[:limit]
+    return Response(view.get_serializer(
+        [ingredient async for ingredient in queryset.aiterator()],
+        many=True,
+    ).data)
+
+
+async def catalog_list(view, request):
+    """Полный список отдает CatalogMixin.acached_response."""
+    raise Unsupported
+
+
+def async_read_view(sync_view, handler):
+    """Оборачивает представление ViewSet из роутера асинхронным.
+    GET-запрос в формате JSON обрабатывает корутина handler(view,
+    request) с асинхронной выборкой данных, остальные запросы и
+    случаи, которые handler не поддерживает, - синхронное представление
+    в потоке.
+    """
+    run_sync = sync_to_async(sync_view)
+
+    async def view(request, *args, **kwargs):
+        if request.method == 'GET':
+            try:
+                return await dispatch(
+                    sync_view, handler, request, args, kwargs)
+            except Unsupported:
+                pass
+        return await run_sync(request, *args, **kwargs)
+
+    view.cls = sync_view.cls
+    view.initkwargs = sync_view.initkwargs
+    view.actions = sync_view.actions
+    view.csrf_exempt = True
+    return view
+
+
+async def dispatch(sync_view, handler, request, args, kwargs):
+    """Повторяет APIView.dispatch с асинхронной аутентификацией."""
+    user = await get_token_user(request)
+    if user is None:
+        raise Unsupported
+    view = sync_view.cls(**sync_view.initkwargs)
+    view.action_map = sync_view.actions
+    view.args, view.kwargs = args, kwargs
+    request = view.initialize_request(request, *args, **kwargs)
+    request.user = user
+    view.request = request
+    view.headers = view.default_response_headers
+    try:
+        view.initial(request)
+        if not isinstance(request.accepted_renderer, JSONRenderer):
+            raise Unsupported
+        response = await view.aconditional_response(
+            lambda request: handler(view, request), request)
+    except Unsupported:
+        raise
+    except Exception as exc:
+        response = view.handle_exception(exc)
+    view.response = view.finalize_response(request, response)
+    return view.response
+
+
+ASYNC_READ_HANDLERS = {
+    'recipes-list': recipe_list,
+    'recipes-detail': recipe_detail,
+    'ingredients-list': ingredient_list,
+    'tags-list': catalog_list,
+}
+
+
+def async_read_urls(patterns):
+    """Заменяет маршруты роутера из ASYNC_READ_HANDLERS асинхронными."""
+    return [
+        re_path(
+            str(pattern.pattern),
+            async_read_view(pattern.callback,
+                            ASYNC_READ_HANDLERS[pattern.name]),
+            name=pattern.name,
+        )
+        if pattern.name in ASYNC_READ_HANDLERS else pattern
+        for pattern in patterns
+    ]
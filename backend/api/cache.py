@@ -0,0 +1,253 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.metrics import CACHE_REQUESTS
+from recipes.models import Recipe, Tag
+
+VERSION_KEY = 'foodgram:version:{}'
+RESPONSE_KEY = 'foodgram:response:{}'
+
+
+def get_cache():
+    """Возвращает кэш, в котором хранятся версии и ответы API."""
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def get_versions(*names):
+    """Возвращает текущие значения счетчиков версий.
+    Отсутствующий счетчик инициализируется временем, чтобы после
+    вытеснения из кэша не совпасть со старым значением.
+    """
+    cache = get_cache()
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+async def aget_versions(*names):
+    """Асинхронный вариант get_versions."""
+    cache = get_cache()
+    keys = [VERSION_KEY.format(name) for name in names]
+    versions = await cache.aget_many(keys)
+    for key in keys:
+        if key not in versions:
+            await cache.aadd(key, time.time_ns(), timeout=None)
+            versions[key] = await cache.aget(key)
+    return [versions[key] for key in keys]
+
+
+def bump_versions(*names):
+    """Увеличивает счетчики версий."""
+    cache = get_cache()
+    for name in set(names):
+        key = VERSION_KEY.format(name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def bump_versions_on_commit(*names):
+    """Увеличивает счетчики версий после фиксации транзакции."""
+    transaction.on_commit(lambda: bump_versions(*names))
+
+
+def recipe_version_names(recipe_ids, tag_ids=()):
+    """Возвращает счетчики версий, зависящие от рецептов."""
+    names = ['recipes']
+    names += [f'recipe:{recipe_id}' for recipe_id in recipe_ids]
+    names += [
+        f'author:{author_id}' for author_id in Recipe.objects.filter(
+            pk__in=recipe_ids).values_list('author_id', flat=True)
+    ]
+    names += [
+        f'tag:{slug}' for slug in Tag.objects.filter(
+            pk__in=tag_ids).values_list('slug', flat=True)
+    ]
+    names += [
+        f'tag:{slug}' for slug in Tag.objects.filter(
+            recipes__in=recipe_ids).values_list('slug', flat=True)
+    ]
+    return names
+
+
+def record_lookup(hit):
+    """Учитывает обращение к кэшу ответов в метрике
+    foodgram_cache_requests_total.
+    """
+    CACHE_REQUESTS.labels('response', 'hit' if hit else 'miss').inc()
+
+
+def user_version_name(user_id):
+    """Счетчик версии данных, которые видит только пользователь:
+    отметок избранного, списка покупок и подписок.
+    """
+    return f'user:{user_id}'
+
+
+class ConditionalGetMixin:
+    """Условные GET-запросы для list и retrieve.
+    ETag - хэш параметров запроса и счетчиков версий из
+    get_cache_versions(), а если ответ зависит от пользователя
+    (versions_per_user), то и его счетчика. Совпавший If-None-Match
+    получает 304 до выборки и сериализации данных.
+    """
+
+    versions_per_user = False
+
+    def get_cache_versions(self):
+        """Счетчики версий, от которых зависит ответ.
+        None - ответ не версионируется, ETag и кэш отключены.
+        """
+        return None
+
+    def get_version_names(self):
+        names = self.get_cache_versions()
+        if names is None:
+            return None
+        user = self.request.user
+        if self.versions_per_user and user.is_authenticated:
+            names = [*names, user_version_name(user.pk)]
+        return names
+
+    def get_version_digest(self):
+        """Хэш запроса и версий, None - если версии не хранятся."""
+        if not hasattr(self, '_version_digest'):
+            names = self.get_version_names()
+            self.set_version_digest(
+                names, None if names is None else get_versions(*names))
+        return self._version_digest
+
+    async def aget_version_digest(self):
+        if not hasattr(self, '_version_digest'):
+            names = self.get_version_names()
+            self.set_version_digest(
+                names, None if names is None else await aget_versions(*names))
+        return self._version_digest
+
+    def set_version_digest(self, names, versions):
+        self._version_digest = None
+        if versions is None or None in versions:
+            return
+        params = sorted(
+            (key, sorted(value for value in values if value))
+            for key, values in self.request.query_params.lists()
+        )
+        raw = json.dumps(
+            [self.basename, self.action, self.kwargs, params,
+             self.request.accepted_media_type, names, versions],
+            sort_keys=True,
+            default=str,
+        )
+        self._version_digest = hashlib.sha256(raw.encode()).hexdigest()
+
+    def get_etag(self):
+        digest = self.get_version_digest()
+        return None if digest is None else f'"{digest}"'
+
+    def patch_conditional_headers(self, response, etag):
+        if etag is not None and response.status_code in (
+                status.HTTP_200_OK, status.HTTP_304_NOT_MODIFIED):
+            response['ETag'] = etag
+        # no-cache: хранить можно, но перед использованием проверять ETag.
+        if self.versions_per_user:
+            patch_vary_headers(response, ('Authorization',))
+        if self.versions_per_user and self.request.user.is_authenticated:
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, no_cache=True)
+        return response
+
+    def not_modified(self, etag):
+        """Ответ 304, если If-None-Match совпадает с etag, иначе None."""
+        # Сравнение слабое: nginx со сжатием делает ETag слабым.
+        if etag is not None and etag in {
+            tag.removeprefix('W/') for tag in parse_etags(
+                self.request.headers.get('If-None-Match', ''))
+        }:
+            return self.patch_conditional_headers(
+                Response(status=status.HTTP_304_NOT_MODIFIED), etag)
+        return None
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        return handler(request, *args, **kwargs)
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        return await handler(request, *args, **kwargs)
+
+    def conditional_response(self, handler, request, *args, **kwargs):
+        etag = self.get_etag()
+        return self.not_modified(etag) or self.patch_conditional_headers(
+            self.cached_response(handler, request, *args, **kwargs), etag)
+
+    async def aconditional_response(self, handler, request, *args,
+                                    **kwargs):
+        """Асинхронный вариант conditional_response, handler - корутина."""
+        await self.aget_version_digest()
+        etag = self.get_etag()
+        return self.not_modified(etag) or self.patch_conditional_headers(
+            await self.acached_response(handler, request, *args, **kwargs),
+            etag)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.conditional_response(
+            super().retrieve, request, *args, **kwargs)
+
+
+class VersionedCacheMixin(ConditionalGetMixin):
+    """Кэширование ответов для анонимных пользователей.
+    Ключ строится из нормализованных параметров запроса и счетчиков
+    версий, которые возвращает get_cache_versions().
+    """
+
+    def get_cache_key(self):
+        digest = self.get_version_digest()
+        return None if digest is None else RESPONSE_KEY.format(digest)
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_cache_key()
+        if request.user.is_authenticated or key is None:
+            return handler(request, *args, **kwargs)
+        cache = get_cache()
+        data = cache.get(key)
+        record_lookup(data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        key = self.get_cache_key()
+        if request.user.is_authenticated or key is None:
+            return await handler(request, *args, **kwargs)
+        cache = get_cache()
+        data = await cache.aget(key)
+        record_lookup(data is not None)
+        if data is not None:
+            return Response(data, headers={'X-Cache': 'HIT'})
+        response = await handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            await cache.aset(
+                key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework.renderers import JSONRenderer
+
+from api.cache import (ConditionalGetMixin, aget_versions, get_cache,
+                       get_versions)
+from api.metrics import CACHE_REQUESTS
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CATALOG_KEY = 'foodgram:catalog:{}'
+TAGS_VERSION = 'tags'
+
+
+def compress(body):
+    """Возвращает тело ответа в поддерживаемых кодировках."""
+    encodings = {
+        'identity': body,
+        'gzip': gzip.compress(body, compresslevel=9, mtime=0),
+    }
+    if brotli is not None:
+        encodings['br'] = brotli.compress(body)
+    return encodings
+
+
+def accepted_encodings(header):
+    """Кодировки из Accept-Encoding, кроме запрещенных через q=0."""
+    encodings = set()
+    for part in header.split(','):
+        coding, _, params = part.partition(';')
+        try:
+            quality = float(params.strip().removeprefix('q=') or 1)
+        except ValueError:
+            quality = 1
+        if coding.strip() and quality > 0:
+            encodings.add(coding.strip().lower())
+    return encodings
+
+
+def choose_encoding(encodings, header):
+    accepted = accepted_encodings(header)
+    for coding in ('br', 'gzip'):
+        if coding in encodings and (coding in accepted or '*' in accepted):
+            return coding
+    return 'identity'
+
+
+class CatalogMixin(ConditionalGetMixin):
+    """Полный список справочника отдается готовыми байтами.
+    JSON и его сжатые варианты строятся один раз на версию счетчика
+    catalog_version и хранятся в кэше CATALOG_CACHE_TIMEOUT секунд,
+    запрос к полному списку стоит одного обращения к кэшу без выборки
+    и сериализации. ETag полного списка - хэш его содержимого: если
+    счетчик сменился в другом процессе, а кэш у процессов свой,
+    клиенты получат новый список после истечения таймаута, а не 304.
+    """
+
+    catalog_version = None
+
+    def get_cache_versions(self):
+        return [self.catalog_version]
+
+    def is_full_catalog(self):
+        return True
+
+    def serves_catalog(self, request):
+        return (self.action == 'list' and self.is_full_catalog()
+                and isinstance(request.accepted_renderer, JSONRenderer))
+
+    def get_etag(self):
+        """Сильный ETag полного списка различается по кодировкам:
+        сжатые представления - это разные байты.
+        """
+        if not self.serves_catalog(self.request):
+            return super().get_etag()
+        digest, encodings = self.get_catalog()
+        coding = self.choose_encoding(encodings)
+        if coding == 'identity':
+            return f'"{digest}"'
+        return f'"{digest}-{coding}"'
+
+    def patch_conditional_headers(self, response, etag):
+        # Vary нужен и ответу 304: ETag зависит от Accept-Encoding.
+        if self.serves_catalog(self.request):
+            patch_vary_headers(response, ('Accept-Encoding',))
+        return super().patch_conditional_headers(response, etag)
+
+    def choose_encoding(self, encodings):
+        return choose_encoding(
+            encodings, self.request.headers.get('Accept-Encoding', ''))
+
+    async def aget_version_digest(self):
+        if self.serves_catalog(self.request):
+            await self.aget_catalog()
+        return await super().aget_version_digest()
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if not self.serves_catalog(request):
+            return handler(request, *args, **kwargs)
+        return self.catalog_response(self.get_catalog()[1])
+
+    async def acached_response(self, handler, request, *args, **kwargs):
+        if not self.serves_catalog(request):
+            return await handler(request, *args, **kwargs)
+        return self.catalog_response((await self.aget_catalog())[1])
+
+    def catalog_response(self, encodings):
+        coding = self.choose_encoding(encodings)
+        response = HttpResponse(
+            encodings[coding], content_type=JSONRenderer.media_type)
+        if coding != 'identity':
+            response['Content-Encoding'] = coding
+        return response
+
+    def get_catalog(self):
+        """Возвращает хэш и закодированный список, при смене версии
+        перестраивает его.
+        """
+        if hasattr(self, '_catalog'):
+            return self._catalog
+        cache = get_cache()
+        key = CATALOG_KEY.format(self.basename)
+        versions = get_versions(*self.get_cache_versions())
+        cached = cache.get(key)
+        if cached is not None and cached[0] == versions:
+            CACHE_REQUESTS.labels('catalog', 'hit').inc()
+            self._catalog = cached[1]
+            return self._catalog
+        CACHE_REQUESTS.labels('catalog', 'miss').inc()
+        self._catalog = self.render_catalog(
+            self.filter_queryset(self.get_queryset()))
+        cache.set(key, (versions, self._catalog),
+                  settings.CATALOG_CACHE_TIMEOUT)
+        return self._catalog
+
+    async def aget_catalog(self):
+        if hasattr(self, '_catalog'):
+            return self._catalog
+        cache = get_cache()
+        key = CATALOG_KEY.format(self.basename)
+        versions = await aget_versions(*self.get_cache_versions())
+        cached = await cache.aget(key)
+        if cached is not None and cached[0] == versions:
+            CACHE_REQUESTS.labels('catalog', 'hit').inc()
+            self._catalog = cached[1]
+            return self._catalog
+        CACHE_REQUESTS.labels('catalog', 'miss').inc()
+        queryset = self.filter_queryset(self.get_queryset())
+        self._catalog = self.render_catalog(
+            [obj async for obj in queryset.aiterator()])
+        await cache.aset(key, (versions, self._catalog),
+                         settings.CATALOG_CACHE_TIMEOUT)
+        return self._catalog
+
+    def render_catalog(self, objects):
+        body = JSONRenderer().render(
+            self.get_serializer(objects, many=True).data)
+        return hashlib.sha256(body).hexdigest(), compress(body)
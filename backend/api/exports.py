@@ -0,0 +1,73 @@
+import csv
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Буфер, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def text_line(row):
+    name, measurement_unit, total_amount = row
+    return f'{total_amount} {measurement_unit}.  {name};\n'
+
+
+def text_format():
+    return 'Список ингредиентов:\n', text_line
+
+
+def csv_format():
+    writerow = csv.writer(Echo()).writerow
+    return writerow(('name', 'measurement_unit', 'total_amount')), writerow
+
+
+EXPORTS = {
+    'txt': (text_format, 'text/plain; charset=utf-8'),
+    'csv': (csv_format, 'text/csv; charset=utf-8'),
+}
+
+
+def lines(header, format_row, rows):
+    yield header
+    for row in rows:
+        yield format_row(row)
+
+
+async def alines(header, format_row, rows):
+    """Асинхронный вариант lines: части курсора читаются в потоке.
+    aiterator() Django 4.2 выполняет запрос values_list() в цикле
+    событий, поэтому не подходит.
+    """
+    yield header
+    next_chunk = sync_to_async(
+        lambda: list(islice(rows, EXPORT_CHUNK_SIZE)))
+    while chunk := await next_chunk():
+        for row in chunk:
+            yield format_row(row)
+
+
+def stream_shopping_list(queryset, export_format, asynchronous=False):
+    """Построчно отдает список покупок в формате txt или csv.
+    Строки читаются из базы курсором, поэтому расход памяти
+    не зависит от размера списка. Под ASGI (asynchronous) нужен
+    асинхронный итератор: синхронный Django 4.2 собирает в список.
+    """
+    make_format, content_type = EXPORTS[export_format]
+    header, format_row = make_format()
+    rows = queryset.values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'total_amount',
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE)
+    content = (alines if asynchronous else lines)(header, format_row, rows)
+    response = StreamingHttpResponse(content, content_type=content_type)
+    response['Content-Disposition'] = (
+        f'attachment; filename="shoplist.{export_format}"')
+    return response
@@ -1,11 +1,38 @@
 import base64
+import binascii
+import io
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from PIL import Image
 from rest_framework import serializers
 
+BASE64_CHUNK_SIZE = 64 * 1024
+BASE64_HEADER_SIZE = 64 * 1024
+
+
+class DecodedImageFile(TemporaryUploadedFile):
+    """Временный файл с декодированным изображением.
+    Закрывается при сборке мусора, в том числе после того,
+    как хранилище переместило его на место.
+    """
+
+    def __del__(self):
+        self.close()
+
 
 class Base64ImageField(serializers.ImageField):
-    """Поле для изображений в формате base64."""
+    """Поле для изображений в формате base64 или файлом multipart/form-data.
+    Размер и разрешение проверяются по заголовку до декодирования
+    изображения, base64 декодируется во временный файл по частям.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер изображения не должен превышать '
+                     '{max_size} байт.',
+        'too_big': 'Ширина и высота изображения не должны превышать '
+                   '{max_dimension} px.',
+    }
 
     def to_internal_value(self, data):
         """Kонвертирует данные в объект файла."""
@@ -13,6 +40,49 @@ class Base64ImageField(serializers.ImageField):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
 
-            data = ContentFile(base64.b64decode(imgstr), name='temp.' + ext)
+            self.check_size(len(imgstr) * 3 // 4)
+            try:
+                header = base64.b64decode(imgstr[:BASE64_HEADER_SIZE])
+            except binascii.Error:
+                self.fail('invalid_image')
+            self.check_dimensions(io.BytesIO(header))
+            data = self.decode_to_file(imgstr, 'temp.' + ext)
+        elif hasattr(data, 'size'):
+            self.check_size(data.size)
+            self.check_dimensions(data)
+            data.seek(0)
 
         return super().to_internal_value(data)
+
+    def check_size(self, size):
+        max_size = settings.RECIPE_IMAGE_MAX_SIZE
+        if size > max_size:
+            self.fail('too_large', max_size=max_size)
+
+    def check_dimensions(self, file):
+        """Проверяет разрешение по заголовку, не декодируя пиксели.
+        Если заголовок не удалось прочитать, проверку выполнит
+        стандартная валидация поля.
+        """
+        try:
+            width, height = Image.open(file).size
+        except Exception:
+            return
+        max_dimension = settings.RECIPE_IMAGE_MAX_DIMENSION
+        if width > max_dimension or height > max_dimension:
+            self.fail('too_big', max_dimension=max_dimension)
+
+    def decode_to_file(self, imgstr, name):
+        """Декодирует base64 во временный файл по частям."""
+        upload = DecodedImageFile(
+            name, f'image/{name.rsplit(".", 1)[-1]}', 0, None)
+        try:
+            for start in range(0, len(imgstr), BASE64_CHUNK_SIZE):
+                upload.write(base64.b64decode(
+                    imgstr[start:start + BASE64_CHUNK_SIZE]))
+        except binascii.Error:
+            upload.close()
+            self.fail('invalid_image')
+        upload.size = upload.tell()
+        upload.seek(0)
+        return upload
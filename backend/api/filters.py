@@ -1,3 +1,6 @@
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Value, When
 from django_filters import rest_framework as filters
 
 from recipes.models import Ingredient, Recipe, Tag
@@ -7,15 +10,41 @@ class IngredientFilter(filters.FilterSet):
     """Фильтр для ингредиентов.
     Этот фильтр используется для фильтрации ингредиентов по их названию.
     Реализует фильтрацию, основанную на частичном совпадении имени ингредиента.
+    Параметр search включает нечеткий поиск с ранжированием результатов.
     """
 
     name = filters.CharFilter(
         field_name='name',
         lookup_expr='istartswith')
+    search = filters.CharFilter(
+        method='search_by_name')
 
     class Meta:
         model = Ingredient
-        fields = ('name',)
+        fields = ('name', 'search')
+
+    def search_by_name(self, queryset, name, value):
+        """Ищет ингредиенты по вхождению и похожести названия.
+        Сначала идут совпадения по началу названия, затем по вхождению,
+        затем похожие по триграммам (только в PostgreSQL).
+        """
+        queryset = queryset.annotate(
+            search_rank=Case(
+                When(name__istartswith=value, then=Value(0)),
+                When(name__icontains=value, then=Value(1)),
+                default=Value(2),
+                output_field=IntegerField(),
+            )
+        )
+        if connection.vendor != 'postgresql':
+            return queryset.filter(
+                name__icontains=value
+            ).order_by('search_rank', 'name')
+        return queryset.annotate(
+            similarity=TrigramSimilarity('name', value)
+        ).filter(
+            Q(name__icontains=value) | Q(name__trigram_similar=value)
+        ).order_by('search_rank', '-similarity', 'name')
 
 
 class RecipeFilter(filters.FilterSet):
@@ -45,10 +74,10 @@ class RecipeFilter(filters.FilterSet):
 
     def get_is_favorited(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(recipefavorite__user=self.request.user)
+            return queryset.filter(is_favorited=True)
         return queryset
 
     def get_is_in_shopping_cart(self, queryset, name, value):
         if value and self.request.user.is_authenticated:
-            return queryset.filter(shoppingcart__user=self.request.user)
+            return queryset.filter(is_in_shopping_cart=True)
         return queryset
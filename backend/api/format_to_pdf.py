@@ -1,34 +1,89 @@
+import hashlib
+import io
+import json
+from functools import lru_cache
+
 from django.conf import settings
 from django.http import HttpResponse
+from reportlab.lib.pagesizes import A4
 from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 from reportlab.pdfgen import canvas
 
+from api.cache import get_cache
+from api.metrics import CACHE_REQUESTS, PDF_RENDER_DURATION
 
-def generate_pdf(ingredient_list):
-    """Генерирует PDF-файл списка ингредиентов.
-    Исподбзуется открытый шрифт DejaVuSerif.
-    """
-    response = HttpResponse(content_type='application/pdf')
-    response['Content-Disposition'] = 'attachment; filename="shoplist.pdf"'
+FONT_NAME = 'DejaVuSerif'
+FONT_SIZE = 14
+LINE_HEIGHT = 25
+TOP = 800
+BOTTOM = 50
+PDF_CACHE_KEY = 'foodgram:pdf:{}'
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """Регистрирует шрифт DejaVuSerif один раз на процесс."""
     font_path = f'{settings.BASE_DIR}/typeface/DejaVuSerif.ttf'
-    pdfmetrics.registerFont(TTFont('DejaVuSerif', font_path))
+    pdfmetrics.registerFont(TTFont(FONT_NAME, font_path))
 
-    p = canvas.Canvas(response)
-    p.setFont('DejaVuSerif', 14)
-    p.drawString(150, 800, 'Список ингредиентов:')
-    p.line(150, 795, 400, 795)
 
-    y = 750
+def render_pdf(ingredient_list):
+    """Рисует список ингредиентов в PDF и возвращает байты документа.
+    Длинные списки переносятся на следующие страницы.
+    """
+    register_font()
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    p.setFont(FONT_NAME, FONT_SIZE)
+    p.drawString(150, TOP, 'Список ингредиентов:')
+    p.line(150, TOP - 5, 400, TOP - 5)
+
+    y = TOP - 50
     for ingredient in ingredient_list:
+        if y < BOTTOM:
+            p.showPage()
+            p.setFont(FONT_NAME, FONT_SIZE)
+            y = TOP
         p.drawString(
             50,
             y,
             f"{ingredient['total_amount']} "
-            f"{ingredient['recipe__ingredients__measurement_unit']}.  "
-            f"{ingredient['recipe__ingredients__name']};",
+            f"{ingredient['measurement_unit']}.  "
+            f"{ingredient['name']};",
         )
-        y -= 25
+        y -= LINE_HEIGHT
     p.showPage()
     p.save()
+    return buffer.getvalue()
+
+
+def get_pdf(ingredient_list):
+    """Возвращает PDF списка ингредиентов из кэша или рисует его.
+    Ключ кэша - хэш содержимого списка покупок.
+    """
+    ingredient_list = list(ingredient_list)
+    digest = hashlib.sha256(
+        json.dumps(ingredient_list, sort_keys=True).encode()
+    ).hexdigest()
+    cache = get_cache()
+    key = PDF_CACHE_KEY.format(digest)
+    content = cache.get(key)
+    if content is not None:
+        CACHE_REQUESTS.labels('pdf', 'hit').inc()
+        return content
+    CACHE_REQUESTS.labels('pdf', 'miss').inc()
+    with PDF_RENDER_DURATION.time():
+        content = render_pdf(ingredient_list)
+    cache.set(key, content, settings.PDF_CACHE_TIMEOUT)
+    return content
+
+
+def generate_pdf(ingredient_list):
+    """Генерирует PDF-файл списка ингредиентов.
+    Исподбзуется открытый шрифт DejaVuSerif.
+    """
+    response = HttpResponse(
+        get_pdf(ingredient_list), content_type='application/pdf')
+    response['Content-Disposition'] = 'attachment; filename="shoplist.pdf"'
     return response
@@ -0,0 +1,142 @@
+import io
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+from api.cache import bump_versions, recipe_version_names
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANT_FORMATS = {'jpeg': 'jpg', 'webp': 'webp'}
+
+_executor = None
+_pending = set()
+
+
+def get_storage():
+    return Recipe._meta.get_field('image').storage
+
+
+def variant_name(source, width, ext):
+    """Имя копии: в каталоге оригинала, чтобы копии разных оригиналов
+    не делили файл.
+    """
+    return f'{get_storage().variants_directory(source)}/{width}.{ext}'
+
+
+def render_variants(name):
+    """Сохраняет уменьшенные копии изображения в JPEG и WebP.
+    Возвращает словарь {формат: [[имя файла, ширина], ...]}.
+    """
+    storage = get_storage()
+    with storage.open(name) as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode != 'RGB':
+        background = Image.new('RGB', image.size, 'white')
+        image = image.convert('RGBA')
+        background.paste(image, mask=image.getchannel('A'))
+        image = background
+    variants = {'source': name}
+    for image_format, ext in VARIANT_FORMATS.items():
+        variants[image_format] = []
+        for width in sorted(settings.RECIPE_IMAGE_VARIANT_WIDTHS):
+            copy = image.copy()
+            copy.thumbnail((width, width * 10))
+            if any(copy.width == saved for _, saved in
+                   variants[image_format]):
+                continue
+            buffer = io.BytesIO()
+            copy.save(buffer, image_format.upper(), quality=85)
+            variant = storage.save(
+                variant_name(name, copy.width, ext),
+                ContentFile(buffer.getvalue()),
+            )
+            variants[image_format].append([variant, copy.width])
+    return variants
+
+
+def save_variants(recipe_id, variants):
+    """Сохраняет варианты, если изображение рецепта не изменилось."""
+    updated = Recipe.objects.filter(
+        pk=recipe_id, image=variants['source']
+    ).update(image_variants=variants)
+    if updated:
+        bump_versions(*recipe_version_names([recipe_id]))
+
+
+def get_executor(reset=False):
+    global _executor
+    if _executor is None or reset:
+        _executor = ProcessPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_VARIANT_WORKERS,
+            mp_context=multiprocessing.get_context('spawn'),
+            initializer=django.setup,
+        )
+    return _executor
+
+
+def _on_variants_ready(key, future):
+    """Сохраняет варианты в служебном потоке пула процессов.
+    Соединение этого потока с БД проверяется и закрывается так же,
+    как в начале и в конце запроса.
+    """
+    _pending.discard(key)
+    close_old_connections()
+    try:
+        save_variants(key[0], future.result())
+    except Exception:
+        logger.exception(
+            'Не удалось создать варианты изображения рецепта %s', key[0])
+    finally:
+        close_old_connections()
+
+
+def schedule_variants(recipe):
+    """Запускает генерацию вариантов изображения в пуле процессов."""
+    key = (recipe.pk, recipe.image.name)
+    if not settings.RECIPE_IMAGE_VARIANTS_ASYNC:
+        save_variants(recipe.pk, render_variants(key[1]))
+        return
+    if key in _pending:
+        return
+    _pending.add(key)
+    try:
+        future = get_executor().submit(render_variants, key[1])
+    except BrokenProcessPool:
+        future = get_executor(reset=True).submit(render_variants, key[1])
+    future.add_done_callback(
+        lambda future: _on_variants_ready(key, future))
+
+
+def has_variants(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get('source') == recipe.image.name)
+
+
+def image_srcset(recipe):
+    """Возвращает srcset для каждого формата изображения рецепта.
+    Пока варианты не созданы, возвращает оригинал.
+    """
+    if not recipe.image:
+        return {}
+    storage = get_storage()
+    if not has_variants(recipe):
+        ext = os.path.splitext(recipe.image.name)[1].lstrip('.').lower()
+        return {'jpeg' if ext == 'jpg' else ext: recipe.image.url}
+    return {
+        image_format: ', '.join(
+            f'{storage.url(name)} {width}w'
+            for name, width in recipe.image_variants[image_format]
+        )
+        for image_format in VARIANT_FORMATS
+    }
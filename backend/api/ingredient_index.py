@@ -0,0 +1,86 @@
+import bisect
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+from api.cache import get_versions
+from recipes.models import Ingredient
+
+logger = logging.getLogger(__name__)
+
+INDEX_VERSION = 'ingredients'
+
+
+class IngredientIndex:
+    """Индекс названий ингредиентов для поиска по префиксу.
+    Хранит отсортированный список названий в нижнем регистре.
+    Индекс устаревает при изменении счетчика версии ингредиентов
+    и через INGREDIENT_INDEX_TIMEOUT секунд после построения: счетчик,
+    измененный в другом процессе, при кэше процесса не виден.
+    """
+
+    def __init__(self):
+        self._state = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    def build(self):
+        """Строит индекс по всем ингредиентам."""
+        version = get_versions(INDEX_VERSION)[0]
+        entries = sorted(
+            (name.casefold(), pk, name, measurement_unit)
+            for pk, name, measurement_unit in Ingredient.objects.order_by(
+            ).values_list('id', 'name', 'measurement_unit').iterator()
+        )
+        keys = [entry[0] for entry in entries]
+        items = [
+            {'id': pk, 'name': name, 'measurement_unit': measurement_unit}
+            for _, pk, name, measurement_unit in entries
+        ]
+        self._state = (version, time.monotonic(), keys, items)
+
+    def warm(self):
+        """Запускает построение индекса в фоновом потоке."""
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=self._build_in_background, daemon=True).start()
+
+    def _build_in_background(self):
+        try:
+            self.build()
+        except Exception:
+            logger.exception('Не удалось построить индекс ингредиентов')
+        finally:
+            self._building = False
+            connection.close()
+
+    def is_stale(self, state):
+        version, built_at, _, _ = state
+        return (
+            time.monotonic() - built_at > settings.INGREDIENT_INDEX_TIMEOUT
+            or version != get_versions(INDEX_VERSION)[0])
+
+    def search(self, prefix, limit=None):
+        """Возвращает ингредиенты, название которых начинается с prefix.
+        Если индекс не построен или устарел, запускает его перестроение
+        и возвращает None.
+        """
+        state = self._state
+        if state is None or self.is_stale(state):
+            self.warm()
+            return None
+        _, _, keys, items = state
+        prefix = prefix.casefold()
+        start = bisect.bisect_left(keys, prefix)
+        end = bisect.bisect_left(keys, prefix + '\U0010ffff', lo=start)
+        if limit is not None:
+            end = min(end, start + limit)
+        return items[start:end]
+
+
+ingredient_index = IngredientIndex()
@@ -0,0 +1,308 @@
+import io
+import json
+import statistics
+import time
+from pathlib import Path
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from api.urls import router
+from recipes.models import Ingredient, Recipe, ShoppingCart, Tag
+from users.models import FoodUser
+
+BENCHMARK_CACHE_ALIAS = 'benchmark'
+PREFIX = 'bench'
+SMALL_PAGE = 2
+LARGE_PAGE = 20
+
+# Маршруты, которые не измеряются: они меняют пароли, почту и учетные
+# записи или не сохраняют данные.
+SKIPPED = {
+    ('users-list', 'post'),
+    ('users-activation', 'post'),
+    ('users-me', 'put'),
+    ('users-me', 'patch'),
+    ('users-me', 'delete'),
+    ('users-resend-activation', 'post'),
+    ('users-reset-password', 'post'),
+    ('users-reset-password-confirm', 'post'),
+    ('users-reset-username', 'post'),
+    ('users-reset-username-confirm', 'post'),
+    ('users-set-password', 'post'),
+    ('users-set-username', 'post'),
+    ('users-detail', 'put'),
+    ('users-detail', 'patch'),
+    ('users-detail', 'delete'),
+    ('users-subscribe', 'post'),
+    ('users-subscribe', 'delete'),
+    ('recipes-list', 'post'),
+    ('recipes-detail', 'put'),
+    ('recipes-detail', 'patch'),
+    ('recipes-detail', 'delete'),
+}
+
+
+class QueryCounter:
+    """Считает SQL-запросы, выполненные через соединение."""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+
+class Command(BaseCommand):
+    help = ('Измеряет число SQL-запросов, задержку и размер ответов '
+            'эндпоинтов API на фиксированном наборе данных и сравнивает '
+            'их с сохраненным базовым уровнем.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument(
+            '--baseline',
+            type=Path,
+            default=settings.BASE_DIR / 'benchmark_endpoints.json',
+            help='файл с базовым уровнем в формате JSON',
+        )
+        parser.add_argument(
+            '--update',
+            action='store_true',
+            help='перезаписать базовый уровень текущими результатами',
+        )
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=0.5,
+            help='допустимый относительный рост медианы, по умолчанию 50%%',
+        )
+        parser.add_argument(
+            '--min-slack',
+            type=float,
+            default=2.0,
+            help='допустимый абсолютный рост медианы в мс',
+        )
+
+    def handle(self, *args, **options):
+        caches = {
+            **settings.CACHES,
+            BENCHMARK_CACHE_ALIAS: {
+                'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+        }
+        with override_settings(
+            CACHES=caches,
+            RESPONSE_CACHE_ALIAS=BENCHMARK_CACHE_ALIAS,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            RECIPE_IMAGE_VARIANTS_ASYNC=False,
+        ), transaction.atomic():
+            self.create_dataset()
+            results, failures = self.run_scenarios(options['repeat'])
+            transaction.set_rollback(True)
+
+        self.check_coverage()
+        baseline = Path(options['baseline'])
+        if options['update'] or not baseline.exists():
+            baseline.write_text(
+                json.dumps(results, indent=2, ensure_ascii=False) + '\n')
+            self.stdout.write(f'Базовый уровень записан в {baseline}')
+        else:
+            failures += self.compare(
+                json.loads(baseline.read_text()), results,
+                options['threshold'], options['min_slack'])
+        if failures:
+            raise CommandError('\n'.join(failures))
+        self.stdout.write(self.style.SUCCESS('Регрессий не найдено'))
+
+    def create_dataset(self):
+        if not Ingredient.objects.exists():
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'{PREFIX} ингредиент {number}',
+                           measurement_unit='г')
+                for number in range(200)
+            )
+        call_command(
+            'generate_fake_data', users=50, recipes=300, follows=10,
+            favorites=20, carts=5, seed=1, prefix=PREFIX,
+            stdout=io.StringIO(), stderr=io.StringIO(),
+        )
+        users = FoodUser.objects.filter(username__startswith=f'{PREFIX}_')
+        self.user = users.annotate(
+            follows=Count('subscriber')).order_by('-follows', 'id').first()
+        recipes = Recipe.objects.filter(name__startswith=f'{PREFIX} ')
+        for recipe in recipes.order_by('id')[:10]:
+            ShoppingCart.objects.get_or_create(user=self.user, recipe=recipe)
+        self.recipe = recipes.exclude(
+            shoppingcart__user=self.user).order_by('id').first()
+        self.author = self.recipe.author
+        self.tag = Tag.objects.order_by('id').first()
+        self.ingredient = Ingredient.objects.order_by('id').first()
+
+    def get_scenarios(self):
+        """Возвращает сценарии: маршрут, метод, аргументы, клиент и
+        параметры запроса. Для постраничных ответов дополнительно
+        сравнивается число запросов на маленькой и большой странице,
+        изменяющие запросы откатываются обратным запросом.
+        """
+        recipe, author = self.recipe.pk, self.author.pk
+        word = self.ingredient.name.split()[0][:3]
+        return [
+            ('recipes-list', 'get', (), 'anon', {}, {'paginated': True}),
+            ('recipes-list', 'get', (), 'auth', {}, {'paginated': True}),
+            ('recipes-list', 'get', (), 'auth', {'pagination': 'cursor'},
+             {'paginated': True}),
+            ('recipes-list', 'get', (), 'auth',
+             {'is_favorited': 1, 'tags': self.tag.slug},
+             {'paginated': True}),
+            ('recipes-list', 'get', (), 'anon', {'author': author},
+             {'paginated': True}),
+            ('recipes-detail', 'get', (recipe,), 'anon', {}, {}),
+            ('recipes-detail', 'get', (recipe,), 'auth', {}, {}),
+            ('recipes-download-shopping-cart', 'get', (), 'auth',
+             {'format': 'pdf'}, {}),
+            ('recipes-download-shopping-cart', 'get', (), 'auth',
+             {'format': 'csv'}, {}),
+            ('recipes-shopping-cart', 'post', (recipe,), 'auth', {},
+             {'after': 'delete'}),
+            ('recipes-shopping-cart', 'delete', (recipe,), 'auth', {},
+             {'before': 'post'}),
+            ('recipes-favorite', 'post', (recipe,), 'auth', {},
+             {'after': 'delete'}),
+            ('recipes-favorite', 'delete', (recipe,), 'auth', {},
+             {'before': 'post'}),
+            ('users-list', 'get', (), 'anon', {}, {'paginated': True}),
+            ('users-list', 'get', (), 'auth', {}, {'paginated': True}),
+            ('users-detail', 'get', (author,), 'auth', {}, {}),
+            ('users-me', 'get', (), 'auth', {}, {}),
+            ('users-subscriptions', 'get', (), 'auth', {},
+             {'paginated': True}),
+            ('users-subscriptions', 'get', (), 'auth', {'recipes_limit': 3},
+             {'paginated': True}),
+            ('tags-list', 'get', (), 'anon', {}, {}),
+            ('tags-detail', 'get', (self.tag.pk,), 'anon', {}, {}),
+            ('ingredients-list', 'get', (), 'anon', {'name': word}, {}),
+            ('ingredients-list', 'get', (), 'anon', {'search': word}, {}),
+            ('ingredients-detail', 'get', (self.ingredient.pk,), 'anon',
+             {}, {}),
+        ]
+
+    def run_scenarios(self, repeat):
+        clients = {'anon': APIClient(), 'auth': APIClient()}
+        clients['auth'].force_authenticate(self.user)
+        results, failures = {}, []
+        for name, method, args, client, params, options in (
+                self.get_scenarios()):
+            key = ' '.join(filter(None, (
+                method.upper(), name, client,
+                '&'.join(f'{k}={v}' for k, v in params.items()))))
+            url = reverse(f'api:{name}', args=args)
+            client = clients[client]
+            before, after = (
+                getattr(client, options[hook]) if hook in options else None
+                for hook in ('before', 'after')
+            )
+            measure = (
+                lambda page_params, count: self.measure(
+                    getattr(client, method), url, page_params, count,
+                    before, after)
+            )
+            if options.get('paginated'):
+                small = measure({**params, 'limit': SMALL_PAGE}, 1)
+                result = measure({**params, 'limit': LARGE_PAGE}, repeat)
+                if result['queries'] > small['queries']:
+                    failures.append(
+                        f'{key}: число запросов растет с размером страницы '
+                        f'({small["queries"]} -> {result["queries"]})')
+            else:
+                result = measure(params, repeat)
+            if not 200 <= result['status'] < 300:
+                failures.append(f'{key}: статус {result["status"]}')
+            results[key] = result
+            self.stdout.write(
+                f'{key}: {result["status"]}, '
+                f'запросов {result["queries"]}, '
+                f'p50 {result["p50_ms"]} мс, p95 {result["p95_ms"]} мс, '
+                f'{result["bytes"]} байт'
+            )
+        return results, failures
+
+    def measure(self, request, url, params, repeat, before=None,
+                after=None):
+        """Выполняет запрос repeat раз после прогревочного."""
+        if params:
+            url = f'{url}?{urlencode(params)}'
+        timings = []
+        for number in range(repeat + 1):
+            if before is not None:
+                before(url)
+            queries = QueryCounter()
+            with connection.execute_wrapper(queries):
+                start = time.perf_counter()
+                response = request(url)
+                content = (b''.join(response.streaming_content)
+                           if response.streaming else response.content)
+                elapsed = (time.perf_counter() - start) * 1000
+            if after is not None:
+                after(url)
+            if number:
+                timings.append(elapsed)
+        return {
+            'status': response.status_code,
+            'queries': queries.count,
+            'p50_ms': round(statistics.median(timings), 2),
+            'p95_ms': round(percentile(timings, 0.95), 2),
+            'bytes': len(content),
+        }
+
+    def check_coverage(self):
+        """Предупреждает о маршрутах роутера без сценария."""
+        measured = {
+            (name, method) for name, method, *_ in self.get_scenarios()}
+        routes = {
+            (pattern.name, method)
+            for pattern in router.urls
+            for method in getattr(pattern.callback, 'actions', None) or ()
+            if method not in ('head', 'options')
+        }
+        for name, method in sorted(routes - measured - SKIPPED):
+            self.stderr.write(self.style.WARNING(
+                f'Нет сценария для {method.upper()} {name}'))
+
+    def compare(self, baseline, results, threshold, min_slack):
+        """Сравнивает результаты с базовым уровнем: статус ответа, число
+        запросов и задержку. Задержка сравнивается по медиане: p95 на
+        небольшом числе повторов слишком шумный.
+        """
+        failures = []
+        for key, result in results.items():
+            previous = baseline.get(key)
+            if previous is None:
+                continue
+            if result['status'] != previous['status']:
+                failures.append(
+                    f'{key}: статус {result["status"]}, '
+                    f'в базовом уровне {previous["status"]}')
+            if result['queries'] > previous['queries']:
+                failures.append(
+                    f'{key}: запросов {result["queries"]}, '
+                    f'в базовом уровне {previous["queries"]}')
+            limit = max(previous['p50_ms'] * (1 + threshold),
+                        previous['p50_ms'] + min_slack)
+            if result['p50_ms'] > limit:
+                failures.append(
+                    f'{key}: медиана {result["p50_ms"]} мс, '
+                    f'в базовом уровне {previous["p50_ms"]} мс')
+        return failures
@@ -0,0 +1,87 @@
+import random
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from api.filters import IngredientFilter
+from api.ingredient_index import IngredientIndex
+from recipes.models import Ingredient
+
+SYLLABLES = (
+    'ба', 'ва', 'го', 'да', 'ке', 'ли', 'му', 'на', 'ор', 'пе',
+    'ра', 'со', 'ту', 'фа', 'хи', 'цу', 'ча', 'шо', 'ют', 'як',
+)
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает поиск ингредиентов по префиксу через индекс '
+            'в памяти и через фильтр базы данных.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--count', type=int, default=100_000)
+        parser.add_argument('--queries', type=int, default=200)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        with transaction.atomic():
+            self.create_ingredients(rng, options['count'])
+            total = Ingredient.objects.count()
+            prefixes = [
+                ''.join(rng.choice(SYLLABLES)
+                        for _ in range(rng.randint(1, 2)))
+                for _ in range(options['queries'])
+            ]
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+
+            start = time.perf_counter()
+            for prefix in prefixes:
+                list(IngredientFilter(
+                    {'name': prefix}, Ingredient.objects.all()
+                ).qs[:limit].values('id', 'name', 'measurement_unit'))
+            db_time = time.perf_counter() - start
+
+            index = IngredientIndex()
+            start = time.perf_counter()
+            index.build()
+            build_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            for prefix in prefixes:
+                index.search(prefix, limit)
+            index_time = time.perf_counter() - start
+
+            transaction.set_rollback(True)
+
+        queries = len(prefixes)
+        self.stdout.write(
+            f'Ингредиентов: {total}, '
+            f'запросов: {queries}, лимит: {limit}'
+        )
+        self.stdout.write(
+            f'Фильтр БД: {db_time / queries * 1e6:.1f} мкс/запрос')
+        self.stdout.write(
+            f'Индекс: {index_time / queries * 1e6:.1f} мкс/запрос '
+            f'(построение {build_time:.2f} с)')
+
+    def create_ingredients(self, rng, count):
+        ingredients = (
+            Ingredient(
+                name=' '.join(
+                    ''.join(rng.choice(SYLLABLES)
+                            for _ in range(rng.randint(2, 4)))
+                    for _ in range(rng.randint(1, 3))
+                ) + f' {number}',
+                measurement_unit=rng.choice(('г', 'мл', 'шт.', 'ст. л.')),
+            )
+            for number in range(count)
+        )
+        batch = []
+        for ingredient in ingredients:
+            batch.append(ingredient)
+            if len(batch) == 5000:
+                Ingredient.objects.bulk_create(batch)
+                batch = []
+        Ingredient.objects.bulk_create(batch)
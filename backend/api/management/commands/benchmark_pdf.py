@@ -0,0 +1,55 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from reportlab.pdfbase.ttfonts import TTFont
+
+from api.format_to_pdf import get_pdf, register_font, render_pdf
+
+
+class Command(BaseCommand):
+    help = 'Измеряет время генерации PDF списка покупок.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=500)
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        ingredient_list = [
+            {
+                'name': f'ингредиент {number}',
+                'measurement_unit': 'г',
+                'total_amount': number * 10,
+            }
+            for number in range(options['lines'])
+        ]
+        repeat = options['repeat']
+
+        start = time.perf_counter()
+        for _ in range(repeat):
+            TTFont('DejaVuSerif', f'{settings.BASE_DIR}/typeface/'
+                                  'DejaVuSerif.ttf')
+        font_time = (time.perf_counter() - start) / repeat
+
+        register_font()
+        start = time.perf_counter()
+        for _ in range(repeat):
+            content = render_pdf(ingredient_list)
+        render_time = (time.perf_counter() - start) / repeat
+
+        get_pdf(ingredient_list)
+        start = time.perf_counter()
+        for _ in range(repeat):
+            get_pdf(ingredient_list)
+        cached_time = (time.perf_counter() - start) / repeat
+
+        self.stdout.write(
+            f'Строк: {options["lines"]}, страниц: '
+            f'{content.count(b"/Type /Page") - content.count(b"/Type /Pages")}'
+            f', размер: {len(content)} байт'
+        )
+        self.stdout.write(
+            f'Разбор шрифта (на каждый запрос до изменений): '
+            f'{font_time * 1000:.2f} мс')
+        self.stdout.write(f'Отрисовка: {render_time * 1000:.2f} мс')
+        self.stdout.write(f'Из кэша: {cached_time * 1000:.3f} мс')
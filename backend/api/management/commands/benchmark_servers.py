@@ -0,0 +1,220 @@
+import asyncio
+import importlib.util
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from api.management.commands.benchmark_endpoints import percentile
+from recipes.models import Ingredient, Recipe
+
+# Приложение, класс воркеров и значение ASYNC_READ_VIEWS.
+SERVERS = {
+    'wsgi': ('foodgram.wsgi:application', 'sync', 'false'),
+    'asgi': ('foodgram.asgi:application', 'uvicorn.workers.UvicornWorker',
+             'true'),
+}
+STARTUP_TIMEOUT = 30
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+class Command(BaseCommand):
+    help = ('Сравнивает пропускную способность и задержки чтения API под '
+            'gunicorn с синхронными воркерами (WSGI) и с воркерами '
+            'uvicorn (ASGI) при одинаковом числе воркеров. Медленные '
+            'клиенты имитируют соединения, которые долго передают запрос.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2)
+        parser.add_argument(
+            '--concurrency', type=int, default=32,
+            help='число одновременных клиентов',
+        )
+        parser.add_argument(
+            '--slow-clients', type=int, default=0,
+            help='число клиентов, передающих заголовки по байту',
+        )
+        parser.add_argument(
+            '--duration', type=float, default=10,
+            help='длительность нагрузки на каждый сервер, с',
+        )
+        parser.add_argument(
+            '--timeout', type=float, default=10,
+            help='таймаут одного запроса, с',
+        )
+        parser.add_argument(
+            '--servers', nargs='+', choices=SERVERS, default=list(SERVERS))
+        parser.add_argument(
+            '--host', default=None,
+            help='заголовок Host, по умолчанию первый из ALLOWED_HOSTS',
+        )
+
+    def handle(self, *args, **options):
+        modules = ['gunicorn'] + ['uvicorn'] * ('asgi' in options['servers'])
+        for module in modules:
+            if importlib.util.find_spec(module) is None:
+                raise CommandError(f'Не установлен пакет {module}')
+        self.host = options['host'] or next(
+            (host for host in settings.ALLOWED_HOSTS
+             if host and host != '*' and not host.startswith('.')),
+            'localhost')
+        paths = self.get_paths()
+        for server in options['servers']:
+            port = free_port()
+            with self.run_server(server, port, options['workers']):
+                self.wait_ready(port, paths[0])
+                stats = asyncio.run(self.load(
+                    port, paths, options['concurrency'],
+                    options['slow_clients'], options['duration'],
+                    options['timeout'],
+                ))
+            self.report(server, stats, options['duration'])
+
+    def get_paths(self):
+        recipe = Recipe.objects.order_by('-pub_date', '-id').first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        if recipe is None or ingredient is None:
+            raise CommandError('Нет данных: загрузите ингредиенты и '
+                               'выполните generate_fake_data')
+        return [
+            '/api/recipes/',
+            f'/api/recipes/{recipe.pk}/',
+            f'/api/ingredients/?name={quote(ingredient.name[:2])}',
+            '/api/tags/',
+        ]
+
+    @contextmanager
+    def run_server(self, server, port, workers):
+        """Запускает gunicorn с конфигурацией проекта и останавливает
+        его при выходе из блока.
+        """
+        application, worker_class, async_views = SERVERS[server]
+        with tempfile.TemporaryDirectory() as metrics_dir:
+            process = subprocess.Popen(
+                [
+                    sys.executable, '-m', 'gunicorn', application,
+                    '--bind', f'127.0.0.1:{port}',
+                    '--workers', str(workers),
+                    '--worker-class', worker_class,
+                    '--log-level', 'warning',
+                ],
+                cwd=settings.BASE_DIR,
+                env={
+                    **os.environ,
+                    'PROMETHEUS_MULTIPROC_DIR': metrics_dir,
+                    'ASYNC_READ_VIEWS': async_views,
+                },
+            )
+            try:
+                yield process
+            finally:
+                process.terminate()
+                try:
+                    process.wait(timeout=STARTUP_TIMEOUT)
+                except subprocess.TimeoutExpired:
+                    process.kill()
+
+    def wait_ready(self, port, path):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            try:
+                status, _ = asyncio.run(self.request(port, path, 5))
+                if status == 200:
+                    return
+            except OSError:
+                pass
+            time.sleep(0.2)
+        raise CommandError(f'Сервер на порту {port} не запустился')
+
+    async def request(self, port, path, timeout):
+        """Выполняет GET-запрос, возвращает статус и задержку в мс."""
+        start = time.perf_counter()
+        reader, writer = await asyncio.wait_for(
+            asyncio.open_connection('127.0.0.1', port), timeout)
+        try:
+            writer.write(
+                f'GET {path} HTTP/1.1\r\nHost: {self.host}\r\n'
+                f'Accept: application/json\r\nConnection: close\r\n\r\n'
+                .encode())
+            await writer.drain()
+            response = await asyncio.wait_for(reader.read(), timeout)
+        finally:
+            writer.close()
+        status = int(response.split(b' ', 2)[1]) if response else 0
+        return status, (time.perf_counter() - start) * 1000
+
+    async def client(self, port, paths, deadline, timeout, number, stats):
+        index = number
+        while time.monotonic() < deadline:
+            path = paths[index % len(paths)]
+            index += 1
+            try:
+                status, elapsed = await self.request(port, path, timeout)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                stats['errors'] += 1
+                continue
+            if status == 200:
+                stats['latencies'].append(elapsed)
+            else:
+                stats['errors'] += 1
+
+    async def slow_client(self, port, path, deadline):
+        """Держит соединение, передавая заголовки по байту в секунду."""
+        while time.monotonic() < deadline:
+            try:
+                reader, writer = await asyncio.open_connection(
+                    '127.0.0.1', port)
+            except OSError:
+                await asyncio.sleep(1)
+                continue
+            try:
+                writer.write(f'GET {path} HTTP/1.1\r\n'.encode())
+                for byte in f'Host: {self.host}\r\nX-Slow: 1\r\n':
+                    if time.monotonic() >= deadline:
+                        break
+                    writer.write(byte.encode())
+                    await writer.drain()
+                    await asyncio.sleep(1)
+            except OSError:
+                pass
+            finally:
+                writer.close()
+
+    async def load(self, port, paths, concurrency, slow_clients, duration,
+                   timeout):
+        stats = {'latencies': [], 'errors': 0}
+        deadline = time.monotonic() + duration
+        await asyncio.gather(
+            *(self.slow_client(port, paths[0], deadline)
+              for _ in range(slow_clients)),
+            *(self.client(port, paths, deadline, timeout, number, stats)
+              for number in range(concurrency)),
+        )
+        return stats
+
+    def report(self, server, stats, duration):
+        latencies = stats['latencies']
+        if not latencies:
+            self.stdout.write(
+                f'{server}: нет успешных ответов, ошибок {stats["errors"]}')
+            return
+        self.stdout.write(
+            f'{server}: {len(latencies) / duration:.0f} запросов/с, '
+            f'p50 {statistics.median(latencies):.1f} мс, '
+            f'p95 {percentile(latencies, 0.95):.1f} мс, '
+            f'p99 {percentile(latencies, 0.99):.1f} мс, '
+            f'max {max(latencies):.1f} мс, ошибок {stats["errors"]}'
+        )
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.images import has_variants, render_variants, save_variants
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = 'Создает уменьшенные копии изображений рецептов.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='пересоздать копии, даже если они уже есть',
+        )
+
+    def handle(self, *args, **options):
+        generated = 0
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True).only('id', 'image', 'image_variants')
+        for recipe in recipes.iterator():
+            if has_variants(recipe) and not options['force']:
+                continue
+            save_variants(recipe.pk, render_variants(recipe.image.name))
+            generated += 1
+        self.stdout.write(
+            self.style.SUCCESS(f'Созданы копии изображений: {generated}'))
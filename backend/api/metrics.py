@@ -0,0 +1,82 @@
+import os
+import time
+
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+REQUESTS = Counter(
+    'foodgram_requests_total',
+    'Количество HTTP-запросов.',
+    ('view', 'method', 'status'),
+)
+REQUEST_DURATION = Histogram(
+    'foodgram_request_duration_seconds',
+    'Время обработки HTTP-запроса.',
+    ('view',),
+)
+DB_QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Количество SQL-запросов на один HTTP-запрос.',
+    ('view',),
+    buckets=QUERY_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'foodgram_db_duration_seconds',
+    'Суммарное время SQL-запросов одного HTTP-запроса.',
+    ('view',),
+)
+CACHE_REQUESTS = Counter(
+    'foodgram_cache_requests_total',
+    'Обращения к кэшу ответов и PDF.',
+    ('cache', 'result'),
+)
+PDF_RENDER_DURATION = Histogram(
+    'foodgram_pdf_render_seconds',
+    'Время отрисовки PDF списка покупок.',
+)
+
+
+def view_name(request):
+    """Возвращает имя представления и действия, например
+    RecipeViewSet.list.
+    """
+    match = request.resolver_match
+    if match is None:
+        return 'unmatched'
+    view_class = getattr(match.func, 'cls', None)
+    if view_class is None:
+        return match.view_name or match.func.__name__
+    actions = getattr(match.func, 'actions', None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f'{view_class.__name__}.{action}'
+
+
+class QueryStats:
+    """Количество и суммарное время SQL-запросов."""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+
+
+def render_metrics():
+    """Возвращает метрики в текстовом формате Prometheus.
+    Если задан PROMETHEUS_MULTIPROC_DIR, метрики собираются из файлов
+    всех процессов gunicorn.
+    """
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
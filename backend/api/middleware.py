@@ -0,0 +1,257 @@
+import hashlib
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack
+from functools import lru_cache
+
+from asgiref.sync import (iscoroutinefunction, markcoroutinefunction,
+                          sync_to_async)
+from django.conf import settings
+from django.db import connections
+
+from api.metrics import (DB_DURATION, DB_QUERIES, REQUEST_DURATION, REQUESTS,
+                         QueryStats, view_name)
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+WHITESPACE = re.compile(r'\s+')
+SLOW_LOG_QUERIES = 20
+
+
+def normalize_sql(sql):
+    """Заменяет значения в SQL на ?, списки IN - на (...).
+    Одинаковые по структуре запросы получают одинаковый текст.
+    """
+    sql = PLACEHOLDER_LIST.sub('(...)', sql)
+    sql = STRING_LITERAL.sub('?', sql)
+    sql = NUMBER_LITERAL.sub('?', sql)
+    return WHITESPACE.sub(' ', sql.replace('%s', '?')).strip()
+
+
+def fingerprint(sql):
+    return hashlib.sha1(sql.encode()).hexdigest()[:12]
+
+
+class RequestTimings:
+    """Замеры одного запроса: SQL, время БД, сериализации, представления
+    и рендеринга.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.render_started = self.render_finished = None
+        self.db_time = 0
+        self.serialize_time = 0
+        self.queries = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - start
+            self.queries[normalize_sql(sql)] += 1
+
+    def server_timing(self, finished):
+        """Возвращает значение заголовка Server-Timing."""
+        total = finished - self.started
+        render = 0
+        if self.render_started is not None:
+            render = (self.render_finished or finished) - self.render_started
+        app = total - self.db_time - self.serialize_time - render
+        metrics = [
+            ('db', self.db_time,
+             f'{sum(self.queries.values())} queries'),
+            ('serialize', self.serialize_time, None),
+            ('app', max(app, 0), None),
+            ('render', render, None),
+            ('total', total, None),
+        ]
+        return ', '.join(
+            f'{name};dur={duration * 1000:.1f}'
+            + (f';desc="{description}"' if description else '')
+            for name, duration, description in metrics
+        )
+
+
+@lru_cache(maxsize=None)
+def timed_serializer_class(serializer_class):
+    """Подкласс сериализатора, который учитывает время serializer.data
+    без запросов к БД в RequestTimings.serialize_time.
+    """
+
+    class TimedSerializer(serializer_class):
+
+        @property
+        def data(self):
+            timings = self._timings
+            start, db_time = time.perf_counter(), timings.db_time
+            try:
+                return super().data
+            finally:
+                timings.serialize_time += (
+                    time.perf_counter() - start
+                    - (timings.db_time - db_time))
+
+    TimedSerializer.__name__ = serializer_class.__name__
+    TimedSerializer.__qualname__ = serializer_class.__qualname__
+    return TimedSerializer
+
+
+class SerializerTimingMixin:
+    """Учитывает время сериализации в Server-Timing для запросов,
+    попавших в выборку RequestTimingMiddleware.
+    """
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        timings = getattr(self.request, '_timings', None)
+        if timings is not None:
+            serializer.__class__ = timed_serializer_class(
+                serializer.__class__)
+            serializer._timings = timings
+        return serializer
+
+
+def wrap_connections(stack, wrapper):
+    for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(wrapper))
+
+
+async def awrap_connections(stack, wrapper):
+    """Подключает wrapper к соединениям потока, в котором async ORM
+    выполняет запросы: соединения с БД у каждого потока свои.
+    """
+    await sync_to_async(wrap_connections)(stack, wrapper)
+
+
+class AsyncCapableMiddleware:
+    """Основа middleware, работающих и в WSGI, и в ASGI без перехода
+    в синхронный режим. Наследники реализуют __call__ и __acall__.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+
+class MetricsMiddleware(AsyncCapableMiddleware):
+    """Собирает метрики Prometheus по каждому запросу: количество,
+    длительность, число и время SQL-запросов по представлениям.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        stats = QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            wrap_connections(stack, stats)
+            response = self.get_response(request)
+        return self.observe(request, response, stats, start)
+
+    async def __acall__(self, request):
+        stats = QueryStats()
+        start = time.perf_counter()
+        with ExitStack() as stack:
+            await awrap_connections(stack, stats)
+            response = await self.get_response(request)
+        return self.observe(request, response, stats, start)
+
+    def observe(self, request, response, stats, start):
+        view = view_name(request)
+        REQUESTS.labels(view, request.method, response.status_code).inc()
+        REQUEST_DURATION.labels(view).observe(time.perf_counter() - start)
+        DB_QUERIES.labels(view).observe(stats.count)
+        DB_DURATION.labels(view).observe(stats.duration)
+        return response
+
+
+class RequestTimingMiddleware(AsyncCapableMiddleware):
+    """Измеряет время БД, сериализации, представления и рендеринга
+    запроса. Для доли запросов REQUEST_TIMING_SAMPLE_RATE добавляет
+    заголовок Server-Timing (при SERVER_TIMING_STAFF_ONLY - только
+    для персонала) и пишет в лог запросы медленнее
+    SLOW_REQUEST_THRESHOLD_MS вместе с повторяющимися SQL.
+    Для потоковых ответов учитывается время до начала передачи.
+    """
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if random.random() >= settings.REQUEST_TIMING_SAMPLE_RATE:
+            return self.get_response(request)
+        timings = request._timings = RequestTimings()
+        with ExitStack() as stack:
+            wrap_connections(stack, timings)
+            response = self.get_response(request)
+        return self.finish(
+            request, response, timings, self.shows_server_timing(request))
+
+    async def __acall__(self, request):
+        if random.random() >= settings.REQUEST_TIMING_SAMPLE_RATE:
+            return await self.get_response(request)
+        timings = request._timings = RequestTimings()
+        with ExitStack() as stack:
+            await awrap_connections(stack, timings)
+            response = await self.get_response(request)
+        # Пользователь сессии загружается из БД при обращении.
+        show = await sync_to_async(self.shows_server_timing)(request)
+        return self.finish(request, response, timings, show)
+
+    def shows_server_timing(self, request):
+        if not settings.SERVER_TIMING_STAFF_ONLY:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+    def finish(self, request, response, timings, show_server_timing):
+        finished = time.perf_counter()
+        if show_server_timing:
+            response['Server-Timing'] = timings.server_timing(finished)
+        duration = (finished - timings.started) * 1000
+        if duration >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            self.log_slow_request(request, response, timings, duration)
+        return response
+
+    def process_template_response(self, request, response):
+        timings = getattr(request, '_timings', None)
+        if timings is not None:
+            timings.render_started = time.perf_counter()
+            response.add_post_render_callback(
+                lambda response: setattr(
+                    timings, 'render_finished', time.perf_counter()))
+        return response
+
+    def log_slow_request(self, request, response, timings, duration):
+        """Пишет в лог медленный запрос и его самые частые SQL.
+        Отпечаток - хэш нормализованного SQL, по нему удобно искать
+        один и тот же N+1 в разных запросах.
+        """
+        queries = timings.queries.most_common(SLOW_LOG_QUERIES)
+        logger.warning(
+            'Медленный запрос %s %s: %s, %.0f мс, SQL: %s запросов '
+            '(%.0f мс), повторяющихся: %s\n%s',
+            request.method,
+            request.get_full_path(),
+            response.status_code,
+            duration,
+            sum(timings.queries.values()),
+            timings.db_time * 1000,
+            sum(1 for count in timings.queries.values() if count > 1),
+            '\n'.join(
+                f'  {count} x {fingerprint(sql)} {sql}'
+                for sql, count in queries
+            ),
+        )
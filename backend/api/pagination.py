@@ -1,5 +1,13 @@
+import json
+
 from django.conf import settings
-from rest_framework.pagination import PageNumberPagination
+from django.core.exceptions import ValidationError
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import (Cursor, CursorPagination,
+                                       PageNumberPagination)
+
+CURSOR_MODE_PARAM = 'pagination'
+CURSOR_MODE = 'cursor'
 
 
 class LimitPagination(PageNumberPagination):
@@ -7,3 +15,109 @@ class LimitPagination(PageNumberPagination):
 
     page_size_query_param = 'limit'
     page_size = settings.DEFAULT_PAGE_SIZE
+
+
+class KeysetPagination(CursorPagination):
+    """Курсорная пагинация по паре полей (значение, id).
+    Курсор хранит значения обоих полей последней записи страницы,
+    поэтому следующая страница выбирается по индексу без OFFSET и COUNT(*).
+    """
+
+    page_size_query_param = 'limit'
+    page_size = settings.DEFAULT_PAGE_SIZE
+    ordering = ('-pub_date', '-id')
+
+    def get_ordering(self, request, queryset, view):
+        return getattr(view, 'cursor_ordering', self.ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+        self.cursor = self.decode_cursor(request)
+        reverse = bool(self.cursor and self.cursor.reverse)
+        ordering = self.ordering
+        if reverse:
+            ordering = tuple(
+                field[1:] if field.startswith('-') else f'-{field}'
+                for field in ordering
+            )
+        queryset = queryset.order_by(*ordering)
+        current_position = self.cursor.position if self.cursor else None
+        if current_position is not None:
+            try:
+                queryset = self.filter_after(
+                    queryset, ordering, json.loads(current_position))
+            except (TypeError, ValueError, ValidationError):
+                raise NotFound(self.invalid_cursor_message)
+
+        results = list(queryset[:self.page_size + 1])
+        has_following = len(results) > self.page_size
+        self.page = results[:self.page_size]
+        if reverse:
+            self.page.reverse()
+            self.has_next = current_position is not None
+            self.has_previous = has_following
+        else:
+            self.has_next = has_following
+            self.has_previous = current_position is not None
+        if self.page:
+            self.previous_position = self.get_position_from_instance(
+                self.page[0], self.ordering)
+            self.next_position = self.get_position_from_instance(
+                self.page[-1], self.ordering)
+        return self.page
+
+    def filter_after(self, queryset, ordering, position):
+        """Оставляет записи, которые идут после позиции курсора."""
+        (field, tie_field), (value, tie_value) = ordering, position
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        tie_lookup = 'gte' if tie_field.startswith('-') else 'lte'
+        field, tie_field = field.lstrip('-'), tie_field.lstrip('-')
+        opts = queryset.model._meta
+        value = opts.get_field(field).to_python(value)
+        tie_value = opts.get_field(tie_field).to_python(tie_value)
+        return queryset.filter(
+            **{f'{field}__{lookup}e': value}
+        ).exclude(
+            **{field: value, f'{tie_field}__{tie_lookup}': tie_value}
+        )
+
+    def get_position_from_instance(self, instance, ordering):
+        field, tie_field = (name.lstrip('-') for name in ordering)
+        return json.dumps([
+            instance._meta.get_field(field).value_to_string(instance),
+            getattr(instance, tie_field),
+        ])
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=False, position=self.next_position))
+
+    def get_previous_link(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(
+            Cursor(offset=0, reverse=True, position=self.previous_position))
+
+
+class CursorModeMixin:
+    """Включает курсорную пагинацию по параметру pagination=cursor."""
+
+    cursor_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if (
+            not hasattr(self, '_paginator')
+            and self.request is not None
+            and self.request.query_params.get(CURSOR_MODE_PARAM)
+            == CURSOR_MODE
+        ):
+            self._paginator = self.cursor_pagination_class()
+        return super().paginator
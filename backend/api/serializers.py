@@ -1,13 +1,17 @@
+import json
+
 from django.contrib.auth import get_user_model
 from django.db import transaction
+from django.http import QueryDict
 from djoser.serializers import UserSerializer
 from rest_framework import serializers
 from rest_framework.validators import UniqueTogetherValidator
 
 from api.fields import Base64ImageField
+from api.images import image_srcset
 from recipes.constant import COOK_TIME_MIN
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingCartTotal, Tag)
 from users.models import Follow, FoodUser
 
 User = get_user_model()
@@ -19,12 +23,24 @@ class FoodUserSerializer(UserSerializer):
 
     def get_is_subscribed(self, obj):
         """Проверка информации о подписке текущего пользователя"""
+        return obj.id in self.get_following_ids()
+
+    def get_following_ids(self):
+        """Возвращает id авторов, на которых подписан текущий пользователь.
+        Множество загружается одним запросом и сохраняется в запросе.
+        """
         request = self.context.get('request')
-        return (
-            request and request.user.is_authenticated
-            and obj.following.filter(
-                user=request.user).exists()
-        )
+        if not request or not request.user.is_authenticated:
+            return frozenset()
+        following_ids = getattr(request, '_following_ids', None)
+        if following_ids is None:
+            following_ids = frozenset(
+                Follow.objects.filter(
+                    user=request.user
+                ).values_list('following_id', flat=True)
+            )
+            request._following_ids = following_ids
+        return following_ids
 
     class Meta:
         model = FoodUser
@@ -61,6 +77,24 @@ class IngredientSerializer(serializers.ModelSerializer):
             'measurement_unit')
 
 
+class RecipeIngredientGetSerializer(serializers.ModelSerializer):
+    """Сериализатор ингредиентов рецепта с указанием количества."""
+
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit')
+
+    class Meta:
+        model = RecipeIngredient
+        fields = (
+            'id',
+            'name',
+            'measurement_unit',
+            'amount'
+        )
+
+
 class ShortIngredientSerializer(serializers.ModelSerializer):
     """Краткий сериализатор для ингредиентов.
     Включает информацию о количестве ингрдиентов.
@@ -104,6 +138,33 @@ class RecipePostSerializer(serializers.ModelSerializer):
             'cooking_time',
         )
 
+    def to_internal_value(self, data):
+        """Разбирает данные multipart/form-data.
+        Ингредиенты передаются строкой JSON, теги - повторяющимся полем.
+        """
+        if isinstance(data, QueryDict):
+            data = self.parse_multipart(data)
+        return super().to_internal_value(data)
+
+    def parse_multipart(self, data):
+        values = data.dict()
+        tags = data.getlist('tags')
+        if len(tags) == 1 and tags[0].startswith('['):
+            tags = tags[0]
+        for field, value in (
+            ('tags', tags), ('ingredients', values.get('ingredients'))
+        ):
+            if value is None:
+                continue
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    raise serializers.ValidationError(
+                        {field: 'Ожидается список в формате JSON.'})
+            values[field] = value
+        return values
+
     def validate(self, data):
         ingredients = data.get('ingredients')
         if not ingredients:
@@ -157,6 +218,8 @@ class RecipePostSerializer(serializers.ModelSerializer):
         instance.tags.set(tags_data)
         RecipeIngredient.objects.filter(recipe=instance).delete()
         self.create_ingredients(instance, ingredients_data)
+        # bulk_create не отправляет post_save, итоги обновляются вручную.
+        ShoppingCartTotal.objects.add_recipe(instance.id)
         return super().update(instance, validated_data)
 
     def to_representation(self, instance):
@@ -169,11 +232,15 @@ class RecipeGetSerializer(serializers.ModelSerializer):
     """Сериализатор для получения информации о рецептах."""
 
     tags = TagSerializer(many=True, read_only=True)
-    author = UserSerializer(read_only=True)
-    ingredients = serializers.SerializerMethodField()
+    author = FoodUserSerializer(read_only=True)
+    ingredients = RecipeIngredientGetSerializer(
+        source='recipe_ingredient',
+        many=True,
+        read_only=True)
     is_favorited = serializers.SerializerMethodField()
     is_in_shopping_cart = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField(read_only=True)
+    image_srcset = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -186,6 +253,7 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'image_srcset',
             'text',
             'cooking_time',
         )
@@ -196,33 +264,30 @@ class RecipeGetSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
-    def get_ingredients(self, obj):
-        """Получает информацию об ингредиентах рецепта."""
-        ingredients_data = []
-        for ingredient in obj.ingredients.all():
-            recipe_ingredient = ingredient.recipe_ingredient.first()
-            amount = recipe_ingredient.amount if recipe_ingredient else None
-            ingredient_data = {
-                'id': ingredient.id,
-                'name': ingredient.name,
-                'measurement_unit': ingredient.measurement_unit,
-                'amount': amount
-            }
-            ingredients_data.append(ingredient_data)
-        return ingredients_data
+    def get_image_srcset(self, obj):
+        """Получает srcset уменьшенных копий изображения по форматам."""
+        return image_srcset(obj)
 
     def get_is_favorited(self, obj):
-        """Проверяет, добавлен ли рецепт в избранное."""
+        """Проверяет, добавлен ли рецепт в избранное.
+        Использует аннотацию queryset, если она есть.
+        """
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
-        return (
+        return bool(
             request and request.user.is_authenticated
             and obj.recipefavorite.filter(user=request.user).exists()
         )
 
     def get_is_in_shopping_cart(self, obj):
-        """Проверяет, добавлен ли рецепт в список покупок."""
+        """Проверяет, добавлен ли рецепт в список покупок.
+        Использует аннотацию queryset, если она есть.
+        """
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
-        return (
+        return bool(
             request
             and request.user.is_authenticated
             and obj.shoppingcart.filter(user=request.user).exists()
@@ -233,14 +298,18 @@ class FollowSerializer(FoodUserSerializer):
     """Сериализатор подписок на авторов и получения их рецептов."""
 
     recipes = serializers.SerializerMethodField()
-    recipes_count = serializers.SerializerMethodField()
+    recipes_count = serializers.IntegerField(read_only=True)
 
     class Meta(FoodUserSerializer.Meta):
         fields = FoodUserSerializer.Meta.fields + ('recipes_count', 'recipes',)
         model = FoodUser
 
     def get_recipes(self, obj):
-        """Получает список рецептов автора."""
+        """Получает список рецептов автора.
+        Использует рецепты, предзагруженные оконным запросом, если они есть.
+        """
+        if hasattr(obj, 'limited_recipes'):
+            return ShortRecipeSerializer(obj.limited_recipes, many=True).data
         recipes = obj.recipes.all()
         pararms = self.context['request'].query_params
         if 'recipes_limit' in pararms:
@@ -250,15 +319,12 @@ class FollowSerializer(FoodUserSerializer):
                 pass
         return ShortRecipeSerializer(recipes, many=True).data
 
-    def get_recipes_count(self, obj):
-        """Получает количество рецептов автора."""
-        return obj.recipes.count()
-
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Краткий сериализатор для рецептов."""
 
     image = serializers.SerializerMethodField(read_only=True)
+    image_srcset = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Recipe
@@ -266,6 +332,7 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             'id',
             'name',
             'image',
+            'image_srcset',
             'cooking_time'
         )
 
@@ -274,6 +341,9 @@ class ShortRecipeSerializer(serializers.ModelSerializer):
             return obj.image.url
         return None
 
+    def get_image_srcset(self, obj):
+        return image_srcset(obj)
+
 
 class FavoritetSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления рецептов в избранное."""
@@ -0,0 +1,89 @@
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from api.cache import (bump_versions_on_commit, recipe_version_names,
+                       user_version_name)
+from api.catalog import TAGS_VERSION
+from api.images import has_variants, schedule_variants
+from api.ingredient_index import INDEX_VERSION, ingredient_index
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow, FoodUser
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(pre_delete, sender=Recipe)
+def recipe_changed(sender, instance, **kwargs):
+    """Сбрасывает кэш рецепта, его автора (и прежнего) и тегов."""
+    names = recipe_version_names([instance.pk])
+    previous_author_id = getattr(instance, '_previous_author_id', None)
+    if previous_author_id is not None:
+        names.append(f'author:{previous_author_id}')
+    bump_versions_on_commit(*names)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_image_saved(sender, instance, **kwargs):
+    """Запускает генерацию вариантов нового изображения рецепта."""
+    if instance.image and not has_variants(instance):
+        transaction.on_commit(lambda: schedule_variants(instance))
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_changed(sender, instance, **kwargs):
+    """Сбрасывает кэш рецепта при изменении его ингредиентов."""
+    bump_versions_on_commit(*recipe_version_names([instance.recipe_id]))
+
+
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_tags_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Сбрасывает кэш рецептов и тегов при изменении их связей."""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    pk_set = pk_set or ()
+    if reverse:
+        recipe_ids, tag_ids = pk_set, [instance.pk]
+    else:
+        recipe_ids, tag_ids = [instance.pk], pk_set
+    if action == 'pre_clear' and reverse:
+        recipe_ids = list(instance.recipes.values_list('pk', flat=True))
+    bump_versions_on_commit(*recipe_version_names(recipe_ids, tag_ids))
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tags_changed(sender, **kwargs):
+    """Сбрасывает кэш тегов и всех рецептов при изменении тегов."""
+    bump_versions_on_commit(TAGS_VERSION, 'catalog')
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredients_changed(sender, **kwargs):
+    """Сбрасывает кэш ингредиентов и всех рецептов, перестраивает
+    индекс ингредиентов после их изменения.
+    """
+    bump_versions_on_commit(INDEX_VERSION, 'catalog')
+    transaction.on_commit(ingredient_index.warm)
+
+
+@receiver(post_save, sender=FoodUser)
+def user_changed(sender, instance, created, update_fields, **kwargs):
+    """Сбрасывает кэш рецептов при изменении данных автора."""
+    if created or update_fields == frozenset(('last_login',)):
+        return
+    bump_versions_on_commit('catalog')
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Follow)
+@receiver(post_delete, sender=Follow)
+def user_marks_changed(sender, instance, **kwargs):
+    """Меняет ETag ответов пользователя при изменении его отметок."""
+    bump_versions_on_commit(user_version_name(instance.user_id))
@@ -0,0 +1,621 @@
+import base64
+import gzip
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock, skipIf
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from PIL import Image
+from prometheus_client.parser import text_string_to_metric_families
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.cache import get_cache
+from api.catalog import brotli, choose_encoding
+from api.ingredient_index import IngredientIndex
+from api.metrics import render_metrics
+from api.middleware import RequestTimings
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, Tag)
+from users.models import Follow
+
+User = get_user_model()
+
+NO_RESPONSE_CACHE = 'no-response-cache'
+PAGE_SIZES = (2, 20)
+
+# Воркер gunicorn: загружает конфигурацию и увеличивает счетчик.
+WORKER = '''
+import runpy
+config = runpy.run_path('gunicorn.conf.py')
+config['on_starting'](None)
+from api.metrics import REQUESTS
+REQUESTS.labels('Worker.test', 'get', '200').inc()
+'''
+
+
+@override_settings(
+    CACHES={
+        **settings.CACHES,
+        NO_RESPONSE_CACHE: {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache'},
+    },
+    RESPONSE_CACHE_ALIAS=NO_RESPONSE_CACHE,
+)
+class QueryCountTests(TestCase):
+    """Число SQL-запросов эндпоинтов не растет с размером страницы.
+    Кэш ответов отключен, чтобы каждый запрос доходил до базы.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = [
+            User.objects.create_user(
+                username=f'user{number}', email=f'user{number}@example.com',
+                password='pass')
+            for number in range(5)
+        ]
+        cls.user = cls.users[0]
+        tags = [
+            Tag.objects.create(
+                name=f'Тег {number}', slug=f'tag-{number}',
+                color=f'#00000{number}')
+            for number in range(3)
+        ]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {number}', measurement_unit='г')
+            for number in range(10)
+        ]
+        for number in range(30):
+            recipe = Recipe.objects.create(
+                author=cls.users[number % len(cls.users)],
+                name=f'Рецепт {number}', text='Текст', cooking_time=10)
+            recipe.tags.set(tags[:1 + number % len(tags)])
+            RecipeIngredient.objects.bulk_create(
+                RecipeIngredient(
+                    recipe=recipe, ingredient=ingredient, amount=10)
+                for ingredient in ingredients[:1 + number % 5]
+            )
+            if number % 2:
+                Favorite.objects.create(user=cls.user, recipe=recipe)
+            if number % 3 == 0:
+                ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+        for author in cls.users[1:]:
+            Follow.objects.create(user=cls.user, following=author)
+        cls.recipe = Recipe.objects.order_by('id').first()
+        cls.tag, cls.ingredient = tags[0], ingredients[0]
+
+    def setUp(self):
+        self.anon = APIClient()
+        self.auth = APIClient()
+        self.auth.force_authenticate(self.user)
+
+    def assertQueries(self, client, url, expected):
+        with self.assertNumQueries(expected):
+            response = client.get(url)
+            if response.streaming:
+                b''.join(response.streaming_content)
+        self.assertEqual(response.status_code, 200, url)
+
+    def assertPageQueries(self, client, url, expected):
+        separator = '&' if '?' in url else '?'
+        for limit in PAGE_SIZES:
+            with self.subTest(url=url, limit=limit):
+                self.assertQueries(
+                    client, f'{url}{separator}limit={limit}', expected)
+
+    def test_recipe_list(self):
+        self.assertPageQueries(self.anon, '/api/recipes/', 4)
+        self.assertPageQueries(self.auth, '/api/recipes/', 5)
+        self.assertPageQueries(
+            self.auth, '/api/recipes/?pagination=cursor', 4)
+        self.assertPageQueries(
+            self.auth, f'/api/recipes/?is_favorited=1&tags={self.tag.slug}',
+            6)
+        self.assertPageQueries(
+            self.anon, f'/api/recipes/?author={self.user.pk}', 5)
+
+    def test_recipe_detail(self):
+        self.assertQueries(self.anon, f'/api/recipes/{self.recipe.pk}/', 3)
+        self.assertQueries(self.auth, f'/api/recipes/{self.recipe.pk}/', 4)
+
+    def test_shopping_list(self):
+        for export_format in ('pdf', 'txt', 'csv'):
+            self.assertQueries(
+                self.auth,
+                f'/api/recipes/download_shopping_cart/?format={export_format}',
+                1)
+
+    def test_users(self):
+        self.assertPageQueries(self.anon, '/api/users/', 2)
+        self.assertPageQueries(self.auth, '/api/users/', 3)
+        self.assertQueries(self.auth, f'/api/users/{self.users[1].pk}/', 2)
+        self.assertQueries(self.auth, '/api/users/me/', 1)
+        self.assertPageQueries(self.auth, '/api/users/subscriptions/', 4)
+        self.assertPageQueries(
+            self.auth, '/api/users/subscriptions/?recipes_limit=3', 4)
+
+    def test_tags_and_ingredients(self):
+        self.assertQueries(self.anon, '/api/tags/', 1)
+        self.assertQueries(self.anon, f'/api/tags/{self.tag.pk}/', 1)
+        self.assertQueries(self.anon, '/api/ingredients/?search=ингр', 1)
+        self.assertQueries(
+            self.anon, f'/api/ingredients/{self.ingredient.pk}/', 1)
+
+
+class ShoppingListExportTests(TestCase):
+    """Под ASGI список покупок отдается асинхронным итератором,
+    который Django не собирает целиком в память.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='buyer', email='buyer@example.com', password='pass')
+        cls.token = Token.objects.create(user=cls.user)
+        recipe = Recipe.objects.create(
+            author=cls.user, name='Блины', text='Текст', cooking_time=10)
+        for name, amount in (('мука', 200), ('соль', 5)):
+            RecipeIngredient.objects.create(
+                recipe=recipe, amount=amount,
+                ingredient=Ingredient.objects.create(
+                    name=name, measurement_unit='г'))
+        ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    async def test_async_stream(self):
+        expected = {
+            'txt': 'Список ингредиентов:\n200 г.  мука;\n5 г.  соль;\n',
+            'csv': ('name,measurement_unit,total_amount\r\n'
+                    'мука,г,200\r\nсоль,г,5\r\n'),
+        }
+        for export_format, content in expected.items():
+            with self.subTest(export_format=export_format):
+                response = await self.async_client.get(
+                    '/api/recipes/download_shopping_cart/',
+                    {'format': export_format},
+                    headers={'Authorization': f'Token {self.token.key}'})
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(response.is_async)
+                body = b''.join(
+                    [chunk async for chunk in response.streaming_content])
+                self.assertEqual(body.decode(), content)
+
+
+class KeysetPaginationTests(TestCase):
+    """Курсорная пагинация не теряет и не повторяет записи с одинаковой
+    датой публикации, неверный курсор дает 404.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        Recipe.objects.bulk_create(
+            Recipe(author=cls.user, name=f'Рецепт {number}', text='Текст',
+                   cooking_time=10)
+            for number in range(7)
+        )
+        Recipe.objects.update(pub_date=timezone.now())
+        cls.expected = list(
+            Recipe.objects.order_by('-pub_date', '-id').values_list(
+                'id', flat=True))
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def walk(self, url, direction):
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            pages.append([recipe['id'] for recipe in response.data['results']])
+            url = response.data[direction]
+        return pages
+
+    def test_pages_with_equal_pub_date(self):
+        pages = self.walk(
+            '/api/recipes/?pagination=cursor&limit=2', 'next')
+        self.assertEqual(len(pages), 4)
+        self.assertEqual(sum(pages, []), self.expected)
+
+    def test_previous_pages(self):
+        url = '/api/recipes/?pagination=cursor&limit=3'
+        while True:
+            response = self.client.get(url)
+            if response.data['next'] is None:
+                break
+            url = response.data['next']
+        pages = self.walk(response.data['previous'], 'previous')
+        self.assertEqual(sum(reversed(pages), []), self.expected[:6])
+
+    def test_invalid_cursor(self):
+        positions = ('не json', json.dumps(['не дата', 1]),
+                     json.dumps([None]), json.dumps(5))
+        cursors = ['мусор'] + [
+            base64.b64encode(urlencode({'p': position}).encode()).decode()
+            for position in positions
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor=cursor):
+                response = self.client.get(
+                    '/api/recipes/',
+                    {'pagination': 'cursor', 'cursor': cursor})
+                self.assertEqual(response.status_code, 404)
+
+
+@override_settings(RECIPE_IMAGE_MAX_DIMENSION=100)
+class RecipeImageUploadTests(TestCase):
+    """Размер и разрешение изображения проверяются для base64 в JSON
+    и для файла в multipart/form-data.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        cls.tag = Tag.objects.create(
+            name='Завтрак', slug='breakfast', color='#000000')
+        cls.ingredient = Ingredient.objects.create(
+            name='мука', measurement_unit='г')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def png(self, size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def post_json(self, content):
+        image = 'data:image/png;base64,' + base64.b64encode(content).decode()
+        return self.client.post('/api/recipes/', {
+            'ingredients': [{'id': self.ingredient.pk, 'amount': 10}],
+            'tags': [self.tag.pk], 'image': image,
+            'name': 'Блины', 'text': 'Текст', 'cooking_time': 10,
+        }, format='json')
+
+    def post_multipart(self, content):
+        return self.client.post('/api/recipes/', {
+            'ingredients': json.dumps(
+                [{'id': self.ingredient.pk, 'amount': 10}]),
+            'tags': [self.tag.pk],
+            'image': SimpleUploadedFile('photo.png', content, 'image/png'),
+            'name': 'Блины', 'text': 'Текст', 'cooking_time': 10,
+        }, format='multipart')
+
+    def assertRejected(self, content, message):
+        for post in (self.post_json, self.post_multipart):
+            with self.subTest(post=post.__name__):
+                response = post(content)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn(message, str(response.data['image']))
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_accepted(self):
+        for post in (self.post_json, self.post_multipart):
+            with self.subTest(post=post.__name__):
+                self.assertEqual(post(self.png((100, 40))).status_code, 201)
+
+    def test_too_big(self):
+        self.assertRejected(self.png((101, 40)), '100 px')
+
+    def test_too_large(self):
+        content = self.png((10, 10))
+        with override_settings(RECIPE_IMAGE_MAX_SIZE=len(content) - 1):
+            self.assertRejected(content, f'{len(content) - 1} байт')
+
+
+class RecipeCacheTests(TestCase):
+    """Кэш ответов и ETag рецептов сбрасываются после записи."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.other = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass')
+            for name in ('author', 'other')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Блины', text='Текст', cooking_time=10)
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+
+    def update_recipe(self, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            for field, value in fields.items():
+                setattr(self.recipe, field, value)
+            self.recipe.save()
+
+    def test_detail_invalidated(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        self.assertEqual(self.client.get(url)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(url)['X-Cache'], 'HIT')
+        padded = f'/api/recipes/0{self.recipe.pk}/'
+        self.assertEqual(self.client.get(padded).data['name'], 'Блины')
+        self.update_recipe(name='Оладьи')
+        for path in (url, padded):
+            with self.subTest(path=path):
+                response = self.client.get(path)
+                self.assertEqual(response['X-Cache'], 'MISS')
+                self.assertEqual(response.data['name'], 'Оладьи')
+
+    def test_list_invalidated(self):
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Recipe.objects.create(
+                author=self.other, name='Хлеб', text='Текст',
+                cooking_time=30)
+        self.assertEqual(self.client.get('/api/recipes/').data['count'], 2)
+
+    def test_author_change_invalidates_both_authors(self):
+        urls = {
+            self.author: [f'/api/recipes/?author={self.author.pk}',
+                          f'/api/recipes/?author=0{self.author.pk}'],
+            self.other: [f'/api/recipes/?author={self.other.pk}'],
+        }
+        for url in urls[self.author]:
+            self.assertEqual(self.client.get(url).data['count'], 1)
+        self.assertEqual(
+            self.client.get(urls[self.other][0]).data['count'], 0)
+        self.update_recipe(author=self.other)
+        for author, expected in ((self.author, 0), (self.other, 1)):
+            for url in urls[author]:
+                with self.subTest(url=url):
+                    self.assertEqual(
+                        self.client.get(url).data['count'], expected)
+
+    def test_invalid_numbers_not_cached(self):
+        for url in ('/api/recipes/abc/', '/api/recipes/?author=abc'):
+            with self.subTest(url=url):
+                self.assertNotIn('X-Cache', self.client.get(url))
+
+
+@override_settings(REQUEST_TIMING_SAMPLE_RATE=1)
+class RequestTimingTests(TestCase):
+    """Server-Timing со временем сериализации получает только персонал,
+    если не отключен SERVER_TIMING_STAFF_ONLY.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.admin = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass',
+                is_staff=name == 'admin')
+            for name in ('user', 'admin')
+        )
+        Recipe.objects.create(
+            author=cls.user, name='Блины', text='Текст', cooking_time=10)
+
+    def setUp(self):
+        get_cache().clear()
+
+    def server_timing(self, user=None):
+        client = APIClient()
+        if user is not None:
+            client.force_authenticate(user)
+        response = client.get('/api/recipes/')
+        self.assertEqual(response.status_code, 200)
+        if 'Server-Timing' not in response:
+            return None
+        return [entry.split(';')[0]
+                for entry in response['Server-Timing'].split(', ')]
+
+    def test_staff_only(self):
+        self.assertIsNone(self.server_timing())
+        self.assertIsNone(self.server_timing(self.user))
+        self.assertEqual(
+            self.server_timing(self.admin),
+            ['db', 'serialize', 'app', 'render', 'total'])
+
+    @override_settings(SERVER_TIMING_STAFF_ONLY=False)
+    def test_everyone(self):
+        self.assertIsNotNone(self.server_timing())
+
+    def test_serializer_time(self):
+        recorded = []
+
+        def create_timings():
+            recorded.append(RequestTimings())
+            return recorded[-1]
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with mock.patch('api.middleware.RequestTimings',
+                        side_effect=create_timings):
+            response = client.get('/api/recipes/')
+        self.assertEqual(response.data['results'][0]['name'], 'Блины')
+        self.assertGreater(recorded[0].serialize_time, 0)
+
+
+class ConditionalGetTests(TestCase):
+    """Совпавший If-None-Match получает 304, пока данные не изменились."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        cls.recipe = Recipe.objects.create(
+            author=cls.user, name='Блины', text='Текст', cooking_time=10)
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#000000')
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertNotModified(self, url, etag, **headers):
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag, **headers)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag.removeprefix('W/'))
+        return response
+
+    def test_recipe_not_modified_until_changed(self):
+        url = f'/api/recipes/{self.recipe.pk}/'
+        etag = self.client.get(url)['ETag']
+        self.assertNotModified(url, etag)
+        self.assertNotModified(url, f'W/{etag}')
+        with self.captureOnCommitCallbacks(execute=True):
+            Favorite.objects.create(user=self.user, recipe=self.recipe)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_catalog_etag_per_encoding(self):
+        identity = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='')
+        gzipped = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertNotIn('Content-Encoding', identity)
+        self.assertEqual(gzipped['Content-Encoding'], 'gzip')
+        self.assertNotEqual(identity['ETag'], gzipped['ETag'])
+        response = self.assertNotModified(
+            '/api/tags/', gzipped['ETag'], HTTP_ACCEPT_ENCODING='gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        response = self.client.get(
+            '/api/tags/', HTTP_IF_NONE_MATCH=gzipped['ETag'],
+            HTTP_ACCEPT_ENCODING='')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['ETag'], identity['ETag'])
+
+
+class CatalogTests(TestCase):
+    """Полные списки тегов и ингредиентов: выбор сжатия по
+    Accept-Encoding и сброс только при изменении справочника.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.com', password='pass')
+        Tag.objects.create(name='Завтрак', slug='breakfast', color='#000000')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+
+    def setUp(self):
+        get_cache().clear()
+        self.client = APIClient()
+
+    def test_choose_encoding(self):
+        encodings = {'identity': b'', 'gzip': b'', 'br': b''}
+        for header, expected in (
+            ('', 'identity'),
+            ('gzip', 'gzip'),
+            ('gzip, br', 'br'),
+            ('br;q=0, gzip;q=0.5', 'gzip'),
+            ('GZIP;q=0', 'identity'),
+            ('*', 'br'),
+            ('deflate', 'identity'),
+        ):
+            with self.subTest(header=header):
+                self.assertEqual(
+                    choose_encoding(encodings, header), expected)
+        self.assertEqual(
+            choose_encoding({'identity': b'', 'gzip': b''}, 'br, gzip'),
+            'gzip')
+
+    def test_encoded_bodies(self):
+        for url in ('/api/tags/', '/api/ingredients/'):
+            with self.subTest(url=url):
+                identity = self.client.get(url, HTTP_ACCEPT_ENCODING='')
+                response = self.client.get(
+                    url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+                self.assertEqual(response['Content-Encoding'], 'gzip')
+                self.assertIn('Accept-Encoding', response['Vary'])
+                self.assertEqual(
+                    gzip.decompress(response.content), identity.content)
+                self.assertEqual(len(json.loads(identity.content)), 1)
+
+    @skipIf(brotli is None, 'brotli не установлен')
+    def test_brotli(self):
+        identity = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='')
+        response = self.client.get('/api/tags/', HTTP_ACCEPT_ENCODING='br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(
+            brotli.decompress(response.content), identity.content)
+
+    def test_invalidation(self):
+        etags = {
+            url: self.client.get(url)['ETag']
+            for url in ('/api/tags/', '/api/ingredients/')
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = 'Иван'
+            self.user.save()
+        for url, etag in etags.items():
+            self.assertEqual(self.client.get(url)['ETag'], etag)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(name='Обед', slug='lunch', color='#ffffff')
+        response = self.client.get('/api/tags/')
+        self.assertNotEqual(response['ETag'], etags['/api/tags/'])
+        self.assertEqual(len(response.json()), 2)
+        self.assertEqual(
+            self.client.get('/api/ingredients/')['ETag'],
+            etags['/api/ingredients/'])
+
+
+class IngredientIndexTests(TestCase):
+    """Индекс ингредиентов устаревает по таймауту, даже если счетчик
+    версии изменили в другом процессе.
+    """
+
+    def test_index_expires(self):
+        Ingredient.objects.create(name='сахар', measurement_unit='г')
+        index = IngredientIndex()
+        index.build()
+        # bulk_create не отправляет сигналы, как и другой процесс.
+        Ingredient.objects.bulk_create(
+            [Ingredient(name='соль', measurement_unit='г')])
+        with mock.patch.object(index, 'warm') as warm:
+            self.assertEqual(index.search('со'), [])
+            warm.assert_not_called()
+            expired = (time.monotonic()
+                       + settings.INGREDIENT_INDEX_TIMEOUT + 1)
+            with mock.patch('time.monotonic', return_value=expired):
+                self.assertIsNone(index.search('со'))
+            warm.assert_called_once()
+        index.build()
+        self.assertEqual(
+            [item['name'] for item in index.search('со')], ['соль'])
+
+
+class MultiprocessMetricsTests(SimpleTestCase):
+    """Счетчики воркеров gunicorn попадают в общий вывод /api/metrics."""
+
+    def test_worker_counter_in_combined_output(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            env = {**os.environ, 'TMPDIR': temp_dir}
+            env.pop('PROMETHEUS_MULTIPROC_DIR', None)
+            subprocess.run(
+                [sys.executable, '-c', WORKER],
+                cwd=settings.BASE_DIR, env=env, check=True)
+            metrics_dir = os.path.join(temp_dir, 'foodgram_metrics')
+            with mock.patch.dict(
+                    os.environ, PROMETHEUS_MULTIPROC_DIR=metrics_dir):
+                output, _ = render_metrics()
+        samples = {
+            (sample.name, sample.labels.get('view')): sample.value
+            for family in text_string_to_metric_families(output.decode())
+            for sample in family.samples
+        }
+        self.assertEqual(
+            samples.get(('foodgram_requests_total', 'Worker.test')), 1)
@@ -1,8 +1,10 @@
-from django.urls import include, path
+from django.conf import settings
+from django.urls import include, path, re_path
 from rest_framework.routers import DefaultRouter
 
-from api.views import (FoodUserViewSet, IngredientViewSet, RecipeViewSet,
-                       TagViewSet)
+from api.async_views import async_read_urls
+from api.views import (FoodUserViewSet, IngredientViewSet, MetricsView,
+                       RecipeViewSet, TagViewSet)
 
 app_name = 'api'
 
@@ -14,7 +16,12 @@ router.register('tags', TagViewSet, 'tags')
 router.register('ingredients', IngredientViewSet, 'ingredients')
 router.register('recipes', RecipeViewSet, 'recipes')
 
+router_urls = router.urls
+if settings.ASYNC_READ_VIEWS:
+    router_urls = async_read_urls(router_urls)
+
 urlpatterns = [
-    path('', include(router.urls)),
+    path('', include(router_urls)),
     path('auth/', include('djoser.urls.authtoken')),
+    re_path(r'^metrics/?$', MetricsView.as_view(), name='metrics'),
 ]
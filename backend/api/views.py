@@ -1,30 +1,48 @@
-from django.db.models import Sum
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.db.models import (BooleanField, Exists, F, OuterRef, Prefetch,
+                              Value, Window)
+from django.db.models.functions import RowNumber
+from django.http import HttpResponse
 from django.shortcuts import get_object_or_404
 from django_filters import rest_framework as filters
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import IsAuthenticated
+from rest_framework.permissions import IsAdminUser, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from api.cache import VersionedCacheMixin
+from api.catalog import TAGS_VERSION, CatalogMixin
+from api.exports import stream_shopping_list
 from api.filters import IngredientFilter, RecipeFilter
 from api.format_to_pdf import generate_pdf
-from api.pagination import LimitPagination
+from api.ingredient_index import INDEX_VERSION, ingredient_index
+from api.metrics import render_metrics
+from api.middleware import SerializerTimingMixin
+from api.pagination import CursorModeMixin, LimitPagination
 from api.permissions import IsAuthorOrAdminOrReadOnly
+from api.renderers import (CSVRenderer, FormatQueryNegotiation, PDFRenderer,
+                           PlainTextRenderer)
 from api.serializers import (FavoritetSerializer, FollowSerializer,
                              FoodUserSerializer, IngredientSerializer,
                              RecipePostSerializer, ShoppingCartSerializer,
                              SubscriberFollowingSerializer, TagSerializer)
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartTotal, Tag)
 from users.models import Follow, FoodUser
 
 
-class FoodUserViewSet(UserViewSet):
+class FoodUserViewSet(SerializerTimingMixin, CursorModeMixin, UserViewSet):
     """ViewSet для работы с пользователями приложения Foodgramm."""
 
     queryset = FoodUser.objects.all()
     serializer_class = FoodUserSerializer
     pagination_class = LimitPagination
+    cursor_ordering = ('username', 'id')
 
     def get_permissions(self):
         if self.action == 'me':
@@ -57,32 +75,54 @@ class FoodUserViewSet(UserViewSet):
             return Response(status=status.HTTP_204_NO_CONTENT)
         return Response(status=status.HTTP_400_BAD_REQUEST)
 
+    def get_recipes_limit(self):
+        """Возвращает лимит рецептов автора из параметров запроса."""
+        try:
+            return int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return None
+
     @action(detail=False, methods=('get',),
             serializer_class=FollowSerializer,
             permission_classes=[IsAuthenticated])
     def subscriptions(self, request):
         """Получает подписки текущего пользователя."""
         user = self.request.user
-        subscriptions = FoodUser.objects.filter(following__user=user)
-        page = self.paginate_queryset(subscriptions)
-        serializer = FollowSerializer(
-            page,
-            context={'request': request},
-            many=True,
+        recipes = Recipe.objects.annotate(
+            row_number=Window(
+                RowNumber(),
+                partition_by=F('author'),
+                order_by=(F('pub_date').desc(), F('id').desc()),
+            )
         )
+        recipes_limit = self.get_recipes_limit()
+        if recipes_limit is not None:
+            recipes = recipes.filter(row_number__lte=recipes_limit)
+        subscriptions = FoodUser.objects.filter(
+            following__user=user
+        ).order_by(
+            'username'
+        ).prefetch_related(
+            Prefetch('recipes', queryset=recipes, to_attr='limited_recipes')
+        )
+        page = self.paginate_queryset(subscriptions)
+        serializer = self.get_serializer(page, many=True)
         return self.get_paginated_response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(SerializerTimingMixin, CatalogMixin,
+                 viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с тегами."""
 
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     pagination_class = None
+    catalog_version = TAGS_VERSION
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(SerializerTimingMixin, CatalogMixin,
+                        viewsets.ReadOnlyModelViewSet):
     """ViewSet для работы с ингредиентами."""
 
     queryset = Ingredient.objects.all()
@@ -91,17 +131,104 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = IngredientFilter
     pagination_class = None
+    catalog_version = INDEX_VERSION
+
+    def is_full_catalog(self):
+        params = self.request.query_params
+        return not params.get('name') and not params.get('search')
 
+    def list(self, request, *args, **kwargs):
+        return self.conditional_response(
+            self.search, request, *args, **kwargs)
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    """ViewSet для работы с рецептами."""
+    def search(self, request, *args, **kwargs):
+        """Поиск ингредиентов по названию.
+        Поиск по началу названия обслуживается индексом в памяти,
+        а пока индекс не построен, базой данных.
+        """
+        name = request.query_params.get('name')
+        search = request.query_params.get('search')
+        queryset = self.filter_queryset(self.get_queryset())
+        if not name and not search:
+            return Response(self.get_serializer(queryset, many=True).data)
+        limit = settings.INGREDIENT_SEARCH_LIMIT
+        if name and not search:
+            results = ingredient_index.search(name, limit)
+            if results is not None:
+                return Response(results)
+        return Response(
+            self.get_serializer(queryset[:limit], many=True).data)
+
+
+class RecipeViewSet(SerializerTimingMixin, VersionedCacheMixin,
+                    CursorModeMixin, viewsets.ModelViewSet):
+    """ViewSet для работы с рецептами.
+    Ответы анонимным пользователям кэшируются, на чтение поддерживаются
+    условные запросы по ETag.
+    """
 
     queryset = Recipe.objects.order_by('-pub_date').all()
     serializer_class = RecipePostSerializer
     permission_classes = (IsAuthorOrAdminOrReadOnly,)
     filter_backends = (filters.DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    versions_per_user = True
 
+    def get_queryset(self):
+        """Загружает связанные данные рецептов страницы пакетно.
+        Отметки избранного и списка покупок вычисляются подзапросами
+        для текущего пользователя, у анонимов подзапросы не выполняются.
+        """
+        queryset = super().get_queryset().select_related(
+            'author'
+        ).prefetch_related(
+            'tags',
+            Prefetch(
+                'recipe_ingredient',
+                queryset=RecipeIngredient.objects.select_related(
+                    'ingredient').order_by('ingredient__name'),
+            ),
+        )
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Value(False, output_field=BooleanField()),
+                is_in_shopping_cart=Value(False, output_field=BooleanField()),
+            )
+        return queryset.annotate(
+            is_favorited=Exists(Favorite.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+            is_in_shopping_cart=Exists(ShoppingCart.objects.filter(
+                user=user, recipe=OuterRef('pk'))),
+        )
+
+    def initialize_request(self, request, *args, **kwargs):
+        """Файлы из multipart/form-data сохраняются во временные файлы."""
+        request.upload_handlers = [TemporaryFileUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_cache_versions(self):
+        """Счетчики версий, от которых зависит ответ.
+        Номера из URL приводятся к int, как при сбросе счетчиков:
+        у /api/recipes/01/ иначе был бы свой, никогда не сбрасываемый
+        счетчик. Ответы с нечисловым номером не кэшируются.
+        """
+        params = self.request.query_params
+        try:
+            if self.action == 'retrieve':
+                return ['catalog', f'recipe:{int(self.kwargs["pk"])}']
+            author = int(params['author']) if params.get('author') else None
+        except ValueError:
+            return None
+        names = ['catalog']
+        names += [f'tag:{slug}' for slug in params.getlist('tags')]
+        if author is not None:
+            names.append(f'author:{author}')
+        if len(names) == 1:
+            names.append('recipes')
+        return names
+
+    @transaction.atomic
     def create_new_object(self, request, pk, serializer_class):
         data = {'user': request.user.id, 'recipe': pk}
         serializer = serializer_class(data=data, context={'request': request})
@@ -109,13 +236,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
         serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @transaction.atomic
     def delete_object(self, request, pk, model):
         recipe = get_object_or_404(Recipe, id=pk)
         deleted_count, _ = model.objects.filter(
             user=request.user, recipe=recipe).delete()
         if deleted_count:
-            return Response(status=status.HTTP_400_BAD_REQUEST)
-        return Response(status=status.HTTP_204_NO_CONTENT)
+            return Response(status=status.HTTP_204_NO_CONTENT)
+        return Response(status=status.HTTP_400_BAD_REQUEST)
 
     @action(detail=True, methods=('post',),
             permission_classes=(IsAuthenticated,))
@@ -137,17 +265,37 @@ class RecipeViewSet(viewsets.ModelViewSet):
 
     @action(
         ['get'],
-        detail=False)
+        detail=False,
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(PDFRenderer, PlainTextRenderer, CSVRenderer),
+        content_negotiation_class=FormatQueryNegotiation)
     def download_shopping_cart(self, request):
-        """Загрузка списка покупок в формате PDF."""
-        ingredient_list = ShoppingCart.objects.filter(
+        """Загрузка списка покупок.
+        Формат задается параметром format: pdf (по умолчанию), txt или csv.
+        """
+        totals = ShoppingCartTotal.objects.filter(
             user=request.user
-        ).values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit',
-        ).annotate(
-            total_amount=Sum('recipe__recipe_ingredient__amount')
-        ).order_by('recipe__ingredients__name')
+        ).order_by('ingredient__name')
+        export_format = request.accepted_renderer.format
+        if export_format != PDFRenderer.format:
+            return stream_shopping_list(
+                totals, export_format,
+                asynchronous=isinstance(request._request, ASGIRequest))
+        ingredient_list = totals.values(
+            'total_amount',
+            name=F('ingredient__name'),
+            measurement_unit=F('ingredient__measurement_unit'),
+        )
 
         pdf_response = generate_pdf(ingredient_list)
         return pdf_response
+
+
+class MetricsView(APIView):
+    """Метрики приложения в формате Prometheus для администраторов."""
+
+    permission_classes = (IsAdminUser,)
+
+    def get(self, request):
+        content, content_type = render_metrics()
+        return HttpResponse(content, content_type=content_type)
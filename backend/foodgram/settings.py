@@ -22,6 +22,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'rest_framework',
     'djoser',
     'django_filters',
@@ -33,6 +34,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.MetricsMiddleware',
+    'api.middleware.RequestTimingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -76,6 +79,26 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', 'foodgram'),
+    }
+}
+
+RESPONSE_CACHE_ALIAS = 'default'
+
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+CATALOG_CACHE_TIMEOUT = int(os.getenv('CATALOG_CACHE_TIMEOUT', 300))
+
+INGREDIENT_INDEX_TIMEOUT = int(os.getenv('INGREDIENT_INDEX_TIMEOUT', 300))
+
+PDF_CACHE_TIMEOUT = int(os.getenv('PDF_CACHE_TIMEOUT', 3600))
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -137,8 +160,36 @@ STATIC_ROOT = BASE_DIR / 'collected_static'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+RECIPE_IMAGE_MAX_SIZE = 10 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_DIMENSION = 6000
+
+RECIPE_IMAGE_VARIANT_WIDTHS = (160, 480, 1080)
+
+RECIPE_IMAGE_VARIANTS_ASYNC = (
+    os.getenv('RECIPE_IMAGE_VARIANTS_ASYNC', 'true').lower() == 'true')
+
+RECIPE_IMAGE_VARIANT_WORKERS = int(
+    os.getenv('RECIPE_IMAGE_VARIANT_WORKERS', 2))
+
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 AUTH_USER_MODEL = 'users.FoodUser'
 
 DEFAULT_PAGE_SIZE = 6
+
+INGREDIENT_SEARCH_LIMIT = 50
+
+REQUEST_TIMING_SAMPLE_RATE = float(
+    os.getenv('REQUEST_TIMING_SAMPLE_RATE', 0.01))
+
+SERVER_TIMING_STAFF_ONLY = (
+    os.getenv('SERVER_TIMING_STAFF_ONLY', 'true').lower() == 'true')
+
+SLOW_REQUEST_THRESHOLD_MS = int(os.getenv('SLOW_REQUEST_THRESHOLD_MS', 500))
+
+# Асинхронные представления чтения рецептов, тегов и ингредиентов.
+# Включать только вместе с ASGI (foodgram.asgi): под WSGI каждый
+# запрос к ним выполнялся бы в отдельном цикле событий.
+ASYNC_READ_VIEWS = (
+    os.getenv('ASYNC_READ_VIEWS', 'false').lower() == 'true')
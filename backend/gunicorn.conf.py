@@ -0,0 +1,25 @@
+import os
+import shutil
+import tempfile
+
+# Воркеры пишут метрики в общий каталог, /api/metrics собирает их вместе.
+# Каталог задается до импорта prometheus_client: способ хранения значений
+# метрик выбирается при импорте.
+os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'foodgram_metrics'),
+)
+
+from prometheus_client import multiprocess  # noqa: E402
+
+
+def on_starting(server):
+    """Очищает метрики прошлого запуска."""
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    """Помечает метрики завершившегося воркера."""
+    multiprocess.mark_process_dead(worker.pid)
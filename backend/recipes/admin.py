@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.contrib.admin import display
 from django.utils.html import format_html
 
+from recipes.admin_tools import LargeTableAdminMixin, username_filter
 from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
                             ShoppingCart, Tag)
 
@@ -27,7 +28,7 @@ class TagAdmin(admin.ModelAdmin):
     ordering = ('name',)
 
 
-class IngredientAdmin(admin.ModelAdmin):
+class IngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
 
     list_display = (
         'id',
@@ -41,9 +42,10 @@ class IngredientAdmin(admin.ModelAdmin):
 class IngredientInline(admin.TabularInline):
     model = RecipeIngredient
     extra = 2
+    autocomplete_fields = ('ingredient',)
 
 
-class RecipeAdmin(admin.ModelAdmin):
+class RecipeAdmin(LargeTableAdminMixin, admin.ModelAdmin):
 
     list_display = (
         'id',
@@ -53,16 +55,19 @@ class RecipeAdmin(admin.ModelAdmin):
         'text',
         'cooking_time',
         'total_in_favorites',
+        'in_carts_count',
         'pub_date',
     )
+    list_select_related = ('author',)
     filter_horizontal = ('tags',)
+    autocomplete_fields = ('author',)
     inlines = (IngredientInline,)
     list_display_links = (
         'name',
         'author')
+    search_fields = ('name',)
     list_filter = (
-        'name',
-        'author',
+        username_filter('author', 'автору'),
         'tags')
 
     @display(description='Изображение')
@@ -71,30 +76,36 @@ class RecipeAdmin(admin.ModelAdmin):
             return format_html(f'<img src="{obj.image.url}" height="50px" />')
         return 'Нет фото'
 
-    @display(description='В избранном')
+    @display(description='В избранном', ordering='favorites_count')
     def total_in_favorites(self, obj):
-        return Favorite.objects.filter(recipe=obj).count()
+        return obj.favorites_count
 
 
-class RecipeIngredientAdmin(admin.ModelAdmin):
+class RecipeIngredientAdmin(LargeTableAdminMixin, admin.ModelAdmin):
 
     list_display = (
         'recipe',
         'ingredient',
         'amount'
     )
+    list_select_related = ('recipe', 'ingredient')
+    autocomplete_fields = ('recipe', 'ingredient')
 
 
-class FavoriteAdmin(admin.ModelAdmin):
+class FavoriteAdmin(LargeTableAdminMixin, admin.ModelAdmin):
 
     list_display = (
         'user',
         'recipe'
     )
     list_display_links = ('user',)
+    list_select_related = ('user', 'recipe')
+    list_filter = (username_filter('user', 'пользователю'),)
+    autocomplete_fields = ('user', 'recipe')
+    ordering = ('-id',)
 
 
-class ShoppingCartAdmin(admin.ModelAdmin):
+class ShoppingCartAdmin(LargeTableAdminMixin, admin.ModelAdmin):
 
     list_display = (
         'user',
@@ -102,6 +113,10 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     )
 
     list_display_links = ('user',)
+    list_select_related = ('user', 'recipe')
+    list_filter = (username_filter('user', 'пользователю'),)
+    autocomplete_fields = ('user', 'recipe')
+    ordering = ('-id',)
 
 
 admin.site.register(Tag, TagAdmin)
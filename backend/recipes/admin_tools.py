@@ -0,0 +1,82 @@
+from django.contrib import admin
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from recipes.constant import ADMIN_EXACT_COUNT_LIMIT
+
+
+def estimated_count(model, using):
+    """Оценка числа строк таблицы по статистике PostgreSQL.
+    Возвращает None, если оценки нет.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SELECT reltuples FROM pg_class WHERE oid = %s::regclass',
+            [connection.ops.quote_name(model._meta.db_table)],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Пагинатор без полного COUNT(*) по большим таблицам.
+    Без фильтров число строк берется из статистики PostgreSQL, с
+    фильтрами строки считаются не дальше ADMIN_EXACT_COUNT_LIMIT.
+    """
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate > ADMIN_EXACT_COUNT_LIMIT:
+                return estimate
+        return queryset.order_by()[:ADMIN_EXACT_COUNT_LIMIT].count()
+
+
+class LargeTableAdminMixin:
+    """Список объектов большой таблицы без точного подсчета строк."""
+
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class InputFilter(admin.SimpleListFilter):
+    """Фильтр с полем ввода вместо списка всех значений.
+    Значение сравнивается с полем lookup, например author__username.
+    """
+
+    template = 'admin/input_filter.html'
+    lookup = None
+
+    def lookups(self, request, model_admin):
+        # Непустой список нужен, чтобы админка показала фильтр.
+        return ((None, None),)
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(**{self.lookup: self.value().strip()})
+        return queryset
+
+    def choices(self, changelist):
+        all_choice = next(super().choices(changelist))
+        all_choice['query_parts'] = [
+            (key, value) for key, value in changelist.params.items()
+            if key != self.parameter_name
+        ]
+        yield all_choice
+
+
+def username_filter(field, title):
+    """Создает фильтр по точному имени пользователя в поле field."""
+    return type(f'{field.title()}UsernameFilter', (InputFilter,), {
+        'title': title,
+        'parameter_name': field,
+        'lookup': f'{field}__username',
+    })
@@ -3,3 +3,4 @@ COOK_TIME_MAX = 32767
 MAX_CHAR_FIELD_LENGTH = 200
 MIN_AMOUNT_OF_INGREDIENT = 1
 MAX_AMOUNT_OF_INGREDIENT = 32767
+ADMIN_EXACT_COUNT_LIMIT = 10000
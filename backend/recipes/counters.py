@@ -0,0 +1,45 @@
+from django.contrib.auth import get_user_model
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from recipes.models import Favorite, Recipe, ShoppingCart
+
+User = get_user_model()
+
+# Модель и поле счетчика, модель и внешний ключ считаемых строк.
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+)
+
+
+def count_of(model, field):
+    """Подзапрос с количеством строк model, ссылающихся на запись."""
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef('pk')}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def reconcile_counters(recipes=None, users=None):
+    """Исправляет счетчики, разошедшиеся с фактическим количеством.
+    Можно ограничить проверку наборами рецептов и пользователей.
+    Возвращает число исправленных записей по каждому счетчику.
+    """
+    querysets = {Recipe: recipes, User: users}
+    fixed = {}
+    for model, field, related_model, related_field in COUNTERS:
+        queryset = querysets[model]
+        if queryset is None:
+            queryset = model.objects.all()
+        actual = count_of(related_model, related_field)
+        drifted = queryset.annotate(actual=actual).exclude(
+            **{field: F('actual')})
+        fixed[f'{model.__name__}.{field}'] = model.objects.filter(
+            pk__in=drifted.values('pk')
+        ).update(**{field: actual})
+    return fixed
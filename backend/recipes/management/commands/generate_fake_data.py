@@ -0,0 +1,266 @@
+import csv
+import io
+import json
+import random
+import time
+from datetime import timedelta
+from itertools import accumulate
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from api.cache import bump_versions_on_commit
+from api.catalog import TAGS_VERSION
+from recipes.counters import reconcile_counters
+from recipes.models import (Favorite, Ingredient, Recipe, RecipeIngredient,
+                            ShoppingCart, ShoppingCartTotal, Tag)
+from recipes.utils import batched
+from users.models import Follow
+
+User = get_user_model()
+
+COPY_NULL = r'\N'
+
+
+class ZipfSampler:
+    """Выборка элементов с частотой, обратной рангу в степени s.
+    Ранги раздаются элементам в случайном порядке, поэтому
+    популярность не связана с id.
+    """
+
+    def __init__(self, rng, items, s=1.1):
+        self.rng = rng
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.cum_weights = list(accumulate(
+            1 / rank ** s for rank in range(1, len(self.items) + 1)))
+
+    def sample(self, k, exclude=None):
+        """Возвращает до k различных элементов."""
+        picked = set(self.rng.choices(
+            self.items, cum_weights=self.cum_weights, k=k))
+        picked.discard(exclude)
+        return picked
+
+
+class Command(BaseCommand):
+    help = ('Создает синтетические данные для нагрузочного тестирования: '
+            'пользователей, рецепты, подписки, избранное и списки покупок.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--recipes', type=int, default=10000)
+        parser.add_argument(
+            '--follows', type=float, default=20,
+            help='среднее число подписок пользователя',
+        )
+        parser.add_argument(
+            '--favorites', type=float, default=30,
+            help='среднее число избранных рецептов пользователя',
+        )
+        parser.add_argument(
+            '--carts', type=float, default=5,
+            help='среднее число рецептов в списке покупок',
+        )
+        parser.add_argument(
+            '--ingredients', type=int, default=6,
+            help='среднее число ингредиентов рецепта',
+        )
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument(
+            '--prefix', default='fake',
+            help='префикс имен пользователей и названий рецептов',
+        )
+        parser.add_argument(
+            '--password', default='password',
+            help='пароль всех созданных пользователей',
+        )
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.now = timezone.now()
+        self.rows = 0
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(
+                f'Пользователи с префиксом {prefix} уже есть, '
+                'укажите другой --prefix')
+        ingredient_ids = list(Ingredient.objects.values_list('id', flat=True))
+        if not ingredient_ids:
+            raise CommandError('Сначала загрузите ингредиенты: '
+                               'python manage.py load_ingredients')
+
+        started = time.perf_counter()
+        with transaction.atomic():
+            tag_ids = self.get_tag_ids()
+            user_ids = self.create_users(
+                prefix, options['users'], options['password'])
+            authors = ZipfSampler(self.rng, user_ids)
+            recipe_ids = self.create_recipes(
+                prefix, options['recipes'], authors)
+            self.create_recipe_relations(
+                recipe_ids, tag_ids,
+                ZipfSampler(self.rng, ingredient_ids),
+                options['ingredients'],
+            )
+            self.create_links(
+                Follow, 'user_id', 'following_id',
+                user_ids, authors, options['follows'], exclude_self=True)
+            recipes = ZipfSampler(self.rng, recipe_ids)
+            self.create_links(
+                Favorite, 'user_id', 'recipe_id',
+                user_ids, recipes, options['favorites'])
+            self.create_links(
+                ShoppingCart, 'user_id', 'recipe_id',
+                user_ids, recipes, options['carts'])
+            self.write_rows(
+                ShoppingCartTotal,
+                ShoppingCartTotal.objects.calculate(
+                    User.objects.filter(
+                        username__startswith=f'{prefix}_').values('id')
+                ).iterator(chunk_size=self.batch_size),
+            )
+            reconcile_counters(
+                recipes=Recipe.objects.filter(
+                    name__startswith=f'{prefix} рецепт '),
+                users=User.objects.filter(username__startswith=f'{prefix}_'),
+            )
+            bump_versions_on_commit(TAGS_VERSION, 'catalog', 'recipes')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано строк: {self.rows} за {elapsed:.1f} с '
+            f'({self.rows / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
+
+    def write_rows(self, model, rows):
+        """Записывает строки пачками: COPY в PostgreSQL, иначе bulk_create.
+        Строка - словарь значений по attname, остальные поля получают
+        значения по умолчанию.
+        """
+        fields = [
+            field for field in model._meta.concrete_fields
+            if not field.primary_key
+        ]
+        for batch in batched(rows, self.batch_size):
+            if connection.vendor == 'postgresql':
+                self.copy_batch(model, fields, batch)
+            else:
+                model.objects.bulk_create(
+                    (model(**row) for row in batch),
+                    batch_size=self.batch_size,
+                )
+            self.rows += len(batch)
+            self.stderr.write(
+                f'\r{model._meta.verbose_name_plural}: {self.rows}', ending='')
+        self.stderr.write('')
+
+    def copy_batch(self, model, fields, batch):
+        defaults = []
+        for field in fields:
+            default = field.get_default()
+            if isinstance(default, (dict, list)):
+                default = json.dumps(default)
+            defaults.append((field.attname, default))
+        buffer = io.StringIO()
+        csv.writer(buffer).writerows(
+            [
+                COPY_NULL if value is None else value
+                for value in (row.get(name, default)
+                              for name, default in defaults)
+            ]
+            for row in batch
+        )
+        buffer.seek(0)
+        table = connection.ops.quote_name(model._meta.db_table)
+        columns = ', '.join(
+            connection.ops.quote_name(field.column) for field in fields)
+        with connection.cursor() as cursor:
+            cursor.copy_expert(
+                f'COPY {table} ({columns}) '
+                f"FROM STDIN WITH (FORMAT csv, NULL '{COPY_NULL}')",
+                buffer,
+            )
+
+    def get_tag_ids(self):
+        tag_ids = list(Tag.objects.values_list('id', flat=True))
+        if not tag_ids:
+            self.write_rows(Tag, (
+                {
+                    'name': f'Тег {number}',
+                    'slug': f'tag-{number}',
+                    'color': f'#{number * 0x1f2f3f:06x}',
+                }
+                for number in range(8)
+            ))
+            tag_ids = list(Tag.objects.values_list('id', flat=True))
+        return tag_ids
+
+    def create_users(self, prefix, count, password):
+        password = make_password(password)
+        self.write_rows(User, (
+            {
+                'username': f'{prefix}_{number}',
+                'email': f'{prefix}_{number}@example.com',
+                'first_name': f'Имя{number}',
+                'last_name': f'Фамилия{number}',
+                'password': password,
+                'date_joined': self.now,
+            }
+            for number in range(count)
+        ))
+        return list(User.objects.filter(
+            username__startswith=f'{prefix}_'
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipes(self, prefix, count, authors):
+        year = int(timedelta(days=365).total_seconds())
+        self.write_rows(Recipe, (
+            {
+                'author_id': author_id,
+                'name': f'{prefix} рецепт {number}',
+                'text': f'Описание рецепта {number}',
+                'cooking_time': self.rng.randint(5, 180),
+                'pub_date': self.now - timedelta(
+                    seconds=self.rng.randrange(year)),
+            }
+            for number, author_id in enumerate(self.rng.choices(
+                authors.items, cum_weights=authors.cum_weights, k=count))
+        ))
+        return list(Recipe.objects.filter(
+            name__startswith=f'{prefix} рецепт '
+        ).order_by('id').values_list('id', flat=True))
+
+    def create_recipe_relations(self, recipe_ids, tag_ids, ingredients,
+                                per_recipe):
+        self.write_rows(Recipe.tags.through, (
+            {'recipe_id': recipe_id, 'tag_id': tag_id}
+            for recipe_id in recipe_ids
+            for tag_id in self.rng.sample(
+                tag_ids, self.rng.randint(1, min(3, len(tag_ids))))
+        ))
+        self.write_rows(RecipeIngredient, (
+            {
+                'recipe_id': recipe_id,
+                'ingredient_id': ingredient_id,
+                'amount': self.rng.randint(1, 500),
+            }
+            for recipe_id in recipe_ids
+            for ingredient_id in ingredients.sample(
+                self.rng.randint(1, 2 * per_recipe))
+        ))
+
+    def create_links(self, model, owner_field, target_field, owner_ids,
+                     targets, average, exclude_self=False):
+        """Связывает пользователей с популярными по Ципфу объектами."""
+        self.write_rows(model, (
+            {owner_field: owner_id, target_field: target_id}
+            for owner_id in owner_ids
+            for target_id in targets.sample(
+                round(self.rng.uniform(0, 2 * average)),
+                exclude=owner_id if exclude_self else None)
+        ))
@@ -0,0 +1,177 @@
+import json
+import multiprocessing
+import time
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils.dateparse import parse_datetime
+
+from api.cache import bump_versions
+from recipes.models import (ImageReference, Ingredient, Recipe,
+                            RecipeIngredient, Tag, change_counter)
+from recipes.utils import batched
+
+User = get_user_model()
+
+_lookups = None
+
+
+def load_lookups(default_author):
+    """Загружает справочники, по которым разрешаются ссылки рецептов."""
+    authors = dict(User.objects.values_list('username', 'id'))
+    if default_author is not None and default_author not in authors:
+        raise CommandError(f'Пользователь {default_author} не найден')
+    return {
+        'authors': authors,
+        'default_author': authors.get(default_author),
+        'tags': dict(Tag.objects.values_list('slug', 'id')),
+        'ingredients': {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit').iterator()
+        },
+    }
+
+
+def import_batch(lines):
+    """Создает рецепты пачки в одной транзакции.
+    Возвращает количество созданных и пропущенных рецептов и
+    счетчики версий кэша, которые нужно сбросить.
+    """
+    recipes, relations, skipped = [], [], 0
+    for line in lines:
+        # Битая строка или запись без нужных полей пропускается,
+        # а не прерывает загрузку.
+        try:
+            data = json.loads(line)
+            author_id = _lookups['authors'].get(
+                data['author'], _lookups['default_author'])
+            tag_ids = {_lookups['tags'][slug] for slug in data['tags']}
+            amounts = {
+                _lookups['ingredients'][
+                    item['name'], item['measurement_unit']]: item['amount']
+                for item in data['ingredients']
+            }
+            recipe = Recipe(
+                author_id=author_id,
+                name=data['name'],
+                text=data['text'],
+                cooking_time=data['cooking_time'],
+                image=data.get('image') or None,
+            )
+        except (json.JSONDecodeError, KeyError, TypeError):
+            skipped += 1
+            continue
+        if author_id is None:
+            skipped += 1
+            continue
+        recipes.append(recipe)
+        relations.append((data.get('pub_date'), tag_ids, amounts))
+
+    with transaction.atomic():
+        Recipe.objects.bulk_create(recipes)
+        dated = []
+        for recipe, (pub_date, _, _) in zip(recipes, relations):
+            if pub_date:
+                recipe.pub_date = parse_datetime(pub_date)
+                dated.append(recipe)
+        Recipe.objects.bulk_update(dated, ('pub_date',))
+        RecipeIngredient.objects.bulk_create(
+            RecipeIngredient(
+                recipe_id=recipe.pk, ingredient_id=ingredient_id,
+                amount=amount,
+            )
+            for recipe, (_, _, amounts) in zip(recipes, relations)
+            for ingredient_id, amount in amounts.items()
+        )
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.pk, tag_id=tag_id)
+            for recipe, (_, tag_ids, _) in zip(recipes, relations)
+            for tag_id in tag_ids
+        )
+        authors = Counter(recipe.author_id for recipe in recipes)
+        for author_id, count in authors.items():
+            change_counter(User, author_id, 'recipes_count', count)
+        storage = Recipe._meta.get_field('image').storage
+        images = Counter(recipe.image.name for recipe in recipes)
+        images.pop(None, None)
+        for name, count in images.items():
+            ImageReference.objects.acquire(storage, name, count=count)
+    tag_slugs = {tag_id: slug for slug, tag_id in _lookups['tags'].items()}
+    names = {f'author:{author_id}' for author_id in authors}
+    names.update(
+        f'tag:{tag_slugs[tag_id]}'
+        for _, tag_ids, _ in relations for tag_id in tag_ids
+    )
+    return len(recipes), skipped, names
+
+
+def read_batches(path, batch_size):
+    with open(path, encoding='utf-8') as file:
+        yield from batched(
+            (line for line in file if line.strip()), batch_size)
+
+
+class Command(BaseCommand):
+    help = ('Загружает рецепты из JSON Lines, созданного export_recipes. '
+            'Теги и ингредиенты ищутся по slug и по названию с единицей '
+            'измерения, рецепты с неизвестными ссылками пропускаются.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='путь к файлу JSON Lines')
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='количество рецептов в одной транзакции',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='количество параллельных процессов',
+        )
+        parser.add_argument(
+            '--default-author',
+            help='username автора для рецептов, чей автор не найден',
+        )
+
+    def handle(self, *args, **options):
+        global _lookups
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            self.stderr.write(
+                'SQLite не поддерживает параллельную запись, '
+                'используется один процесс.')
+            workers = 1
+
+        started = time.perf_counter()
+        _lookups = load_lookups(options['default_author'])
+        batches = read_batches(options['path'], options['batch_size'])
+        if workers > 1:
+            connections.close_all()
+            pool = multiprocessing.get_context('fork').Pool(workers)
+            results = pool.imap_unordered(import_batch, batches)
+        else:
+            pool, results = None, map(import_batch, batches)
+
+        created = skipped = 0
+        names = {'recipes'}
+        try:
+            for batch_created, batch_skipped, batch_names in results:
+                created += batch_created
+                skipped += batch_skipped
+                names |= batch_names
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        bump_versions(*names)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {created}, пропущено: {skipped} '
+            f'за {elapsed:.2f} с ({created / max(elapsed, 1e-9):.0f} '
+            f'рецептов/с)'
+        ))
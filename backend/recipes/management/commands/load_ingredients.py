@@ -1,29 +1,133 @@
 import csv
+import io
+import json
+import time
+from pathlib import Path
 
-from django.core.management.base import BaseCommand
-from django.db import transaction
-from foodgram import settings
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
+from api.cache import bump_versions_on_commit
+from api.ingredient_index import INDEX_VERSION
 from recipes.models import Ingredient
+from recipes.utils import batched
+
+DEFAULT_PATH = settings.BASE_DIR / 'recipes' / 'data' / 'ingredients.csv'
+
+
+def read_csv(file):
+    for row in csv.reader(file):
+        if len(row) >= 2:
+            yield row[0], row[1]
+
+
+def read_json(file):
+    for item in json.load(file):
+        yield item['name'], item['measurement_unit']
+
+
+def read_jsonl(file):
+    for line in file:
+        if line.strip():
+            item = json.loads(line)
+            yield item['name'], item['measurement_unit']
+
+
+READERS = {'csv': read_csv, 'json': read_json, 'jsonl': read_jsonl}
 
 
 class Command(BaseCommand):
+    help = ('Загружает ингредиенты из CSV, JSON или JSON Lines. '
+            'Существующие ингредиенты пропускаются, поэтому команду '
+            'можно запускать повторно.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--path',
+            default=DEFAULT_PATH,
+            type=Path,
+            help='путь к файлу, по умолчанию recipes/data/ingredients.csv',
+        )
+        parser.add_argument(
+            '--format',
+            choices=READERS,
+            help='формат файла, по умолчанию определяется по расширению',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='количество строк в одной пачке',
+        )
 
     def handle(self, *args, **options):
+        path = options['path']
+        file_format = options['format'] or path.suffix.lstrip('.').lower()
+        if file_format not in READERS:
+            raise CommandError(f'Неизвестный формат файла: {path}')
+        if not path.is_file():
+            raise CommandError(f'Файл не найден: {path}')
+        reader = READERS[file_format]
+        load = (self.load_with_copy if connection.vendor == 'postgresql'
+                else self.load_with_bulk_create)
+
+        started = time.perf_counter()
+        with open(path, encoding='utf-8') as file, transaction.atomic():
+            rows = (
+                (name.strip(), measurement_unit.strip())
+                for name, measurement_unit in reader(file)
+            )
+            total, created = load(
+                (row for row in rows if all(row)), options['batch_size'])
+            bump_versions_on_commit(INDEX_VERSION, 'catalog')
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано строк: {total}, добавлено ингредиентов: {created} '
+            f'за {elapsed:.2f} с ({total / max(elapsed, 1e-9):.0f} строк/с)'
+        ))
 
-        with open(
-            f'{settings.BASE_DIR}/data/ingredients.csv', 'r', encoding='utf-8'
-        ) as csv_file:
-            csv_reader = csv.reader(csv_file)
-            load_ingredients = [
-                Ingredient(
-                    name=row[0],
-                    measurement_unit=row[1])
-                for row in csv_reader
-            ]
-            with transaction.atomic():
-                Ingredient.objects.bulk_create(
-                    load_ingredients)
-            self.stdout.write(
-                self.style.SUCCESS('Данные ingredients_csv загружены')
+    def load_with_bulk_create(self, rows, batch_size):
+        """Загружает пачками через bulk_create с пропуском дублей."""
+        total, before = 0, Ingredient.objects.count()
+        for batch in batched(rows, batch_size):
+            Ingredient.objects.bulk_create(
+                (Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in batch),
+                ignore_conflicts=True,
+            )
+            total += len(batch)
+        return total, Ingredient.objects.count() - before
+
+    def load_with_copy(self, rows, batch_size):
+        """Загружает в PostgreSQL через COPY во временную таблицу.
+        Из временной таблицы новые ингредиенты переносятся одним
+        INSERT ... ON CONFLICT DO NOTHING.
+        """
+        table = Ingredient._meta.db_table
+        total = 0
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMPORARY TABLE ingredient_staging '
+                '(name text, measurement_unit text) ON COMMIT DROP'
+            )
+            for batch in batched(rows, batch_size):
+                buffer = io.StringIO()
+                csv.writer(buffer).writerows(batch)
+                buffer.seek(0)
+                cursor.copy_expert(
+                    'COPY ingredient_staging (name, measurement_unit) '
+                    'FROM STDIN WITH (FORMAT csv)',
+                    buffer,
+                )
+                total += len(batch)
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT DISTINCT name, measurement_unit '
+                'FROM ingredient_staging '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
             )
+            created = cursor.rowcount
+            # ON COMMIT DROP не сработает, пока идет внешняя транзакция.
+            cursor.execute('DROP TABLE ingredient_staging')
+        return total, created
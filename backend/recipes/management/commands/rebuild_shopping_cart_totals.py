@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from recipes.models import ShoppingCartTotal
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает итоги списков покупок по содержимому корзин.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            action='append',
+            dest='user_ids',
+            help='id пользователя, можно указать несколько раз',
+        )
+
+    def handle(self, *args, **options):
+        created = ShoppingCartTotal.objects.rebuild(options['user_ids'])
+        self.stdout.write(
+            self.style.SUCCESS(f'Итоги списков покупок пересчитаны: {created}')
+        )
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счетчики избранного, списков покупок и '
+            'рецептов авторов, если они разошлись с данными.')
+
+    def handle(self, *args, **options):
+        for counter, fixed in reconcile_counters().items():
+            self.stdout.write(f'{counter}: исправлено записей {fixed}')
+        self.stdout.write(self.style.SUCCESS('Счетчики сверены'))
@@ -0,0 +1,38 @@
+# Generated by Django 4.2.9 on 2026-10-18 06:35
+
+from django.db import migrations, models
+
+
+def count_references(apps, schema_editor):
+    Recipe = apps.get_model('recipes', 'Recipe')
+    ImageReference = apps.get_model('recipes', 'ImageReference')
+    ImageReference.objects.bulk_create(
+        ImageReference(name=row['image'], references=row['references'])
+        for row in Recipe.objects.exclude(image__isnull=True).exclude(
+            image=''
+        ).order_by().values('image').annotate(
+            references=models.Count('pk'))
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0014_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageReference',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200, unique=True, verbose_name='Файл')),
+                ('references', models.PositiveIntegerField(default=0, verbose_name='Ссылок')),
+            ],
+            options={
+                'verbose_name': 'Ссылки на изображение',
+                'verbose_name_plural': 'Ссылки на изображения',
+            },
+        ),
+        migrations.RunPython(count_references, migrations.RunPython.noop),
+    ]
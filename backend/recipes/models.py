@@ -1,13 +1,16 @@
 from colorfield.fields import ColorField
 from django.contrib.auth import get_user_model
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
-from django.db.models.signals import pre_delete
+from django.db import models, transaction
+from django.db.models import F, Sum
+from django.db.models.signals import (post_delete, post_save, pre_delete,
+                                      pre_save)
 from django.dispatch import receiver
 
 from recipes.constant import (COOK_TIME_MAX, COOK_TIME_MIN,
                               MAX_AMOUNT_OF_INGREDIENT, MAX_CHAR_FIELD_LENGTH,
                               MIN_AMOUNT_OF_INGREDIENT)
+from recipes.storage import ContentAddressedStorage
 
 User = get_user_model()
 
@@ -69,6 +72,14 @@ class Ingredient(models.Model):
         return self.name
 
 
+def change_counter(model, pk, field, delta):
+    """Атомарно изменяет счетчик строки, не опуская его ниже нуля."""
+    rows = model.objects.filter(pk=pk)
+    if delta < 0:
+        rows = rows.filter(**{f'{field}__gte': -delta})
+    rows.update(**{field: F(field) + delta})
+
+
 class Recipe(models.Model):
     """Модель рецептов."""
 
@@ -84,6 +95,8 @@ class Recipe(models.Model):
     )
     image = models.ImageField(
         upload_to='recipes/images/',
+        storage=ContentAddressedStorage(),
+        db_index=True,
         verbose_name='Фото готового блюда',
         blank=True,
         null=True
@@ -111,22 +124,160 @@ class Recipe(models.Model):
         auto_now_add=True,
         verbose_name='Дата публикации'
     )
+    image_variants = models.JSONField(
+        default=dict,
+        blank=True,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения'
+    )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В избранном'
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='В списках покупок'
+    )
 
     @receiver(pre_delete, sender='recipes.Recipe')
     def delete_recipe_images(sender, instance, **kwargs):
-        """Удаляет изображение рецепта вместе с рецептом."""
+        """Освобождает изображение рецепта при удалении рецепта."""
         if instance.image:
-            instance.image.delete(False)
+            ImageReference.objects.release(
+                instance.image.storage, instance.image.name)
+
+    @receiver(pre_save, sender='recipes.Recipe')
+    def replace_recipe_images(sender, instance, raw=False, **kwargs):
+        """Освобождает прежнее изображение, если рецепт получил новое,
+        и переносит рецепт в счетчике нового автора. Прежнего автора
+        запоминает в _previous_author_id для сброса кэша его рецептов.
+        Ссылку на новое изображение учитывает acquire_recipe_image.
+        """
+        instance._acquire_image = False
+        instance._previous_author_id = None
+        if raw:
+            return
+        image = instance.image
+        # Загруженное содержимое нужно, чтобы восстановить файл, если
+        # его успели удалить вместе с последней ссылкой.
+        instance._image_content = (
+            image.file if image and not image._committed else None)
+        previous = None
+        if instance.pk is not None:
+            previous = Recipe.objects.filter(pk=instance.pk).values(
+                'image', 'author_id').first()
+        if previous is None:
+            instance._acquire_image = bool(image)
+            return
+        if previous['image'] != image.name:
+            instance._acquire_image = bool(image)
+            if previous['image']:
+                ImageReference.objects.release(
+                    image.storage, previous['image'])
+        if previous['author_id'] != instance.author_id:
+            instance._previous_author_id = previous['author_id']
+            change_counter(User, previous['author_id'], 'recipes_count', -1)
+            change_counter(User, instance.author_id, 'recipes_count', 1)
+
+    @receiver(post_save, sender='recipes.Recipe')
+    def acquire_recipe_image(sender, instance, **kwargs):
+        """Учитывает ссылку рецепта на сохраненное изображение."""
+        if getattr(instance, '_acquire_image', False):
+            instance._acquire_image = False
+            ImageReference.objects.acquire(
+                instance.image.storage, instance.image.name,
+                instance._image_content)
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = (
+            models.Index(
+                fields=('-pub_date', '-id'),
+                name='recipe_pub_date_id_idx'
+            ),
+        )
 
     def __str__(self):
         return self.name
 
 
+class ImageReferenceManager(models.Manager):
+    """Подсчет ссылок рецептов на общие файлы изображений.
+    Строка счетчика блокируется до конца транзакции, поэтому удаление
+    файла без ссылок и повторное использование того же файла другим
+    рецептом выполняются по очереди.
+    """
+
+    def lock(self, name):
+        """Блокирует строку счетчика файла, создавая ее при отсутствии."""
+        self.get_or_create(name=name)
+        return self.select_for_update().get(name=name)
+
+    @transaction.atomic
+    def acquire(self, storage, name, content=None, count=1):
+        """Добавляет ссылки на файл.
+        Если файл уже удален вместе с последней ссылкой, он
+        записывается заново из content.
+        """
+        reference = self.lock(name)
+        self.filter(pk=reference.pk).update(
+            references=F('references') + count)
+        if content is not None and not storage.exists(name):
+            storage.write(name, content)
+
+    def release(self, storage, name):
+        """Убирает ссылку на файл. Файл без ссылок и его копии
+        удаляются после фиксации транзакции.
+        """
+        self.filter(name=name, references__gt=0).update(
+            references=F('references') - 1)
+        transaction.on_commit(
+            lambda: self.delete_unreferenced(storage, name))
+
+    @transaction.atomic
+    def delete_unreferenced(self, storage, name):
+        """Удаляет файл, если на него не ссылается ни один рецепт.
+        Рецепты, созданные в обход сигналов, счетчик может не учитывать,
+        поэтому ссылки проверяются и по таблице рецептов. Копии
+        изображения лежат в каталоге оригинала и удаляются вместе
+        с ним, даже если рецепт их не записал.
+        """
+        reference = self.lock(name)
+        if reference.references or Recipe.objects.filter(
+                image=name).exists():
+            return
+        storage.delete_tree(storage.variants_directory(name))
+        storage.delete(name)
+        reference.delete()
+
+
+class ImageReference(models.Model):
+    """Число рецептов, ссылающихся на файл изображения."""
+
+    name = models.CharField(
+        max_length=MAX_CHAR_FIELD_LENGTH,
+        unique=True,
+        verbose_name='Файл'
+    )
+    references = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Ссылок'
+    )
+
+    objects = ImageReferenceManager()
+
+    class Meta:
+        verbose_name = 'Ссылки на изображение'
+        verbose_name_plural = 'Ссылки на изображения'
+
+    def __str__(self):
+        return f'{self.name}: {self.references}'
+
+
 class RecipeIngredient(models.Model):
     """Промежуточная модель ингредиентов."""
 
@@ -184,6 +335,8 @@ class FavoriteShoppingCartBaseModel(models.Model):
 class Favorite(FavoriteShoppingCartBaseModel):
     """Модель избранного."""
 
+    counter_field = 'favorites_count'
+
     class Meta(FavoriteShoppingCartBaseModel.Meta):
         verbose_name = 'Избранное'
         verbose_name_plural = 'Избранные'
@@ -196,12 +349,14 @@ class Favorite(FavoriteShoppingCartBaseModel):
         )
 
     def __str__(self):
-        return self.user
+        return f'{self.user}: {self.recipe}'
 
 
 class ShoppingCart(FavoriteShoppingCartBaseModel):
     """Модель списка покупок."""
 
+    counter_field = 'in_carts_count'
+
     class Meta(FavoriteShoppingCartBaseModel.Meta):
         verbose_name = 'Список покупок'
         verbose_name_plural = 'Списки покупок'
@@ -214,4 +369,205 @@ class ShoppingCart(FavoriteShoppingCartBaseModel):
         )
 
     def __str__(self):
-        return self.user
+        return f'{self.user}: {self.recipe}'
+
+
+class ShoppingCartTotalManager(models.Manager):
+    """Поддержка итогов списков покупок в актуальном состоянии."""
+
+    def add_recipe(self, recipe_id, user_ids=None):
+        """Прибавляет ингредиенты рецепта к итогам пользователей.
+        По умолчанию обновляются все пользователи с рецептом в корзине.
+        """
+        self._apply(recipe_id, user_ids, 1)
+
+    def remove_recipe(self, recipe_id, user_ids=None):
+        """Вычитает ингредиенты рецепта из итогов пользователей."""
+        self._apply(recipe_id, user_ids, -1)
+
+    def change_ingredient(self, recipe_id, ingredient_id, delta):
+        """Изменяет на delta итоги ингредиента у всех пользователей
+        с рецептом в корзине.
+        """
+        if delta:
+            self._apply(recipe_id, None, 1, {ingredient_id: delta})
+
+    @transaction.atomic
+    def _apply(self, recipe_id, user_ids, sign, amounts=None):
+        if user_ids is None:
+            user_ids = list(ShoppingCart.objects.filter(
+                recipe_id=recipe_id).values_list('user_id', flat=True))
+        if not user_ids:
+            return
+        if amounts is None:
+            amounts = dict(RecipeIngredient.objects.filter(
+                recipe_id=recipe_id).values_list('ingredient_id', 'amount'))
+        if not amounts:
+            return
+        list(User.objects.select_for_update().filter(
+            pk__in=user_ids).order_by('pk').values_list('pk', flat=True))
+        existing = {
+            (total.user_id, total.ingredient_id): total
+            for total in self.filter(
+                user_id__in=user_ids, ingredient_id__in=amounts)
+        }
+        to_create, to_update, to_delete = [], [], []
+        for user_id in user_ids:
+            for ingredient_id, amount in amounts.items():
+                delta = sign * amount
+                total = existing.get((user_id, ingredient_id))
+                if total is None:
+                    if delta > 0:
+                        to_create.append(self.model(
+                            user_id=user_id,
+                            ingredient_id=ingredient_id,
+                            total_amount=delta,
+                        ))
+                    continue
+                total.total_amount += delta
+                if total.total_amount > 0:
+                    to_update.append(total)
+                else:
+                    to_delete.append(total.pk)
+        self.bulk_create(to_create)
+        self.bulk_update(to_update, ('total_amount',))
+        self.filter(pk__in=to_delete).delete()
+
+    @transaction.atomic
+    def rebuild(self, user_ids=None, batch_size=1000):
+        """Пересчитывает итоги с нуля по содержимому корзин."""
+        totals = self.all()
+        if user_ids is not None:
+            totals = totals.filter(user_id__in=user_ids)
+        totals.delete()
+        rows = self.calculate(user_ids).iterator()
+        return len(self.bulk_create(
+            (self.model(**row) for row in rows), batch_size=batch_size))
+
+    def calculate(self, user_ids=None):
+        """Возвращает итоги, посчитанные по корзинам, в виде словарей."""
+        carts = ShoppingCart.objects.filter(
+            recipe__recipe_ingredient__isnull=False)
+        if user_ids is not None:
+            carts = carts.filter(user_id__in=user_ids)
+        return carts.values(
+            'user_id',
+            ingredient_id=models.F('recipe__recipe_ingredient__ingredient'),
+        ).annotate(
+            total_amount=Sum('recipe__recipe_ingredient__amount')
+        ).order_by()
+
+
+class ShoppingCartTotal(models.Model):
+    """Итоговое количество ингредиента в списке покупок пользователя."""
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        verbose_name='Пользователь'
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент'
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество'
+    )
+
+    objects = ShoppingCartTotalManager()
+
+    class Meta:
+        verbose_name = 'Итог списка покупок'
+        verbose_name_plural = 'Итоги списков покупок'
+        default_related_name = 'shopping_cart_totals'
+        constraints = (
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_user_ingredient_total'
+            ),
+        )
+
+    def __str__(self):
+        return f'{self.ingredient}, {self.total_amount}'
+
+
+@receiver(post_save, sender=ShoppingCart)
+def add_to_shopping_cart_totals(sender, instance, created, **kwargs):
+    """Прибавляет рецепт к итогам списка покупок."""
+    if created:
+        ShoppingCartTotal.objects.add_recipe(
+            instance.recipe_id, [instance.user_id])
+
+
+@receiver(post_delete, sender=ShoppingCart)
+def remove_from_shopping_cart_totals(sender, instance, **kwargs):
+    """Вычитает рецепт из итогов списка покупок.
+    При каскадном удалении рецепта его ингредиенты могут быть уже
+    удалены: тогда их вычел recipe_ingredient_deleted.
+    """
+    ShoppingCartTotal.objects.remove_recipe(
+        instance.recipe_id, [instance.user_id])
+
+
+@receiver(pre_save, sender=RecipeIngredient)
+def remember_recipe_ingredient(sender, instance, **kwargs):
+    """Запоминает сохраненную строку, чтобы обновить итоги на разницу."""
+    instance._previous = None
+    if instance.pk is not None:
+        instance._previous = sender.objects.filter(pk=instance.pk).values_list(
+            'recipe_id', 'ingredient_id', 'amount').first()
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def recipe_ingredient_saved(sender, instance, **kwargs):
+    """Переносит изменение ингредиента рецепта в итоги списков покупок."""
+    amount = instance.amount
+    previous = getattr(instance, '_previous', None)
+    if previous is not None:
+        recipe_id, ingredient_id, previous_amount = previous
+        if (recipe_id, ingredient_id) == (
+                instance.recipe_id, instance.ingredient_id):
+            amount -= previous_amount
+        else:
+            ShoppingCartTotal.objects.change_ingredient(
+                recipe_id, ingredient_id, -previous_amount)
+    ShoppingCartTotal.objects.change_ingredient(
+        instance.recipe_id, instance.ingredient_id, amount)
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def recipe_ingredient_deleted(sender, instance, **kwargs):
+    """Вычитает удаленный ингредиент рецепта из итогов списков покупок.
+    Если корзины удалены раньше, вычитать уже нечего.
+    """
+    ShoppingCartTotal.objects.change_ingredient(
+        instance.recipe_id, instance.ingredient_id, -instance.amount)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def favorite_or_cart_added(sender, instance, created, raw=False, **kwargs):
+    """Увеличивает счетчик избранного или списков покупок рецепта."""
+    if created and not raw:
+        change_counter(Recipe, instance.recipe_id, sender.counter_field, 1)
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def favorite_or_cart_removed(sender, instance, **kwargs):
+    """Уменьшает счетчик избранного или списков покупок рецепта."""
+    change_counter(Recipe, instance.recipe_id, sender.counter_field, -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(sender, instance, created, raw=False, **kwargs):
+    """Увеличивает счетчик рецептов автора."""
+    if created and not raw:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(sender, instance, **kwargs):
+    """Уменьшает счетчик рецептов автора."""
+    change_counter(User, instance.author_id, 'recipes_count', -1)
@@ -0,0 +1,63 @@
+import hashlib
+import os
+import uuid
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ContentAddressedStorage(FileSystemStorage):
+    """Хранилище, именующее файлы по SHA-256 содержимого.
+    Файл сохраняется как <каталог>/ab/cd/<хэш>.<расширение>, поэтому
+    одинаковые изображения хранятся в одном экземпляре, а повторная
+    загрузка не пишет на диск. Производные файлы (уменьшенные копии)
+    хранятся в каталоге variants_directory() исходного файла: разные
+    исходные файлы могут дать одинаковые копии, но не общий файл.
+    """
+
+    def get_available_name(self, name, max_length=None):
+        """Имя не подбирается: итоговое задает хэш содержимого."""
+        return name.replace('\\', '/')
+
+    def hashed_name(self, name, content):
+        digest = hashlib.sha256()
+        for chunk in content.chunks():
+            digest.update(chunk)
+        if hasattr(content, 'seek'):
+            content.seek(0)
+        digest = digest.hexdigest()
+        directory, file_name = os.path.split(name)
+        ext = os.path.splitext(file_name)[1].lower()
+        return '/'.join(
+            part for part in
+            (directory, digest[:2], digest[2:4], digest + ext) if part
+        )
+
+    def _save(self, name, content):
+        name = self.hashed_name(name, content)
+        if not self.exists(name):
+            self.write(name, content)
+        return name
+
+    def write(self, name, content):
+        """Записывает содержимое под готовым именем через временный
+        файл, чтобы читатели не видели файл частично записанным.
+        """
+        temp_name = super()._save(f'{name}.{uuid.uuid4().hex}.tmp', content)
+        os.replace(self.path(temp_name), self.path(name))
+
+    def variants_directory(self, name):
+        """Каталог производных файлов name: <каталог>/ab/cd/<хэш>."""
+        return os.path.splitext(name)[0]
+
+    def delete_tree(self, name):
+        """Удаляет каталог name вместе с содержимым."""
+        if not self.exists(name):
+            return
+        directories, files = self.listdir(name)
+        for file_name in files:
+            self.delete(f'{name}/{file_name}')
+        for directory in directories:
+            self.delete_tree(f'{name}/{directory}')
+        self.delete(name)
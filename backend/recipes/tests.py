@@ -0,0 +1,385 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from api.images import VARIANT_FORMATS, render_variants, save_variants
+from recipes.counters import reconcile_counters
+from recipes.models import (Favorite, ImageReference, Ingredient, Recipe,
+                            RecipeIngredient, ShoppingCart, ShoppingCartTotal,
+                            Tag)
+
+User = get_user_model()
+
+
+class ShoppingCartTotalTests(TestCase):
+    """Итоги списков покупок совпадают с пересчетом по корзинам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.buyer, cls.other = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass')
+            for name in ('author', 'buyer', 'other')
+        )
+        cls.tag = Tag.objects.create(name='Тег', slug='tag', color='#000000')
+        cls.salt, cls.flour, cls.milk = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('соль', 'мука', 'молоко')
+        )
+        cls.recipe, cls.second = (
+            Recipe.objects.create(
+                author=cls.author, name=name, text='Текст', cooking_time=10)
+            for name in ('Блины', 'Хлеб')
+        )
+        cls.row = RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.salt, amount=2)
+        RecipeIngredient.objects.create(
+            recipe=cls.recipe, ingredient=cls.flour, amount=100)
+        RecipeIngredient.objects.create(
+            recipe=cls.second, ingredient=cls.flour, amount=300)
+        for user in (cls.buyer, cls.other):
+            ShoppingCart.objects.create(user=user, recipe=cls.recipe)
+        ShoppingCart.objects.create(user=cls.buyer, recipe=cls.second)
+
+    def assertTotalsCalculated(self):
+        stored = set(ShoppingCartTotal.objects.values_list(
+            'user_id', 'ingredient_id', 'total_amount'))
+        calculated = {
+            (row['user_id'], row['ingredient_id'], row['total_amount'])
+            for row in ShoppingCartTotal.objects.calculate()
+        }
+        self.assertEqual(stored, calculated)
+
+    def test_cart_changes(self):
+        self.assertTotalsCalculated()
+        ShoppingCart.objects.create(user=self.other, recipe=self.second)
+        self.assertTotalsCalculated()
+        ShoppingCart.objects.filter(user=self.buyer).delete()
+        self.assertTotalsCalculated()
+
+    def test_amount_changed(self):
+        self.row.amount = 7
+        self.row.save()
+        self.assertTotalsCalculated()
+
+    def test_ingredient_replaced(self):
+        self.row.ingredient = self.milk
+        self.row.amount = 50
+        self.row.save()
+        self.assertTotalsCalculated()
+
+    def test_row_moved_to_other_recipe(self):
+        self.row.recipe = self.second
+        self.row.save()
+        self.assertTotalsCalculated()
+
+    def test_row_added(self):
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=self.milk, amount=200)
+        self.assertTotalsCalculated()
+
+    def test_row_deleted(self):
+        self.row.delete()
+        self.assertTotalsCalculated()
+        RecipeIngredient.objects.filter(recipe=self.recipe).delete()
+        self.assertTotalsCalculated()
+
+    def test_cascades(self):
+        self.recipe.delete()
+        self.assertTotalsCalculated()
+        self.flour.delete()
+        self.assertTotalsCalculated()
+        self.buyer.delete()
+        self.assertTotalsCalculated()
+
+    def test_recipe_updated_through_api(self):
+        client = APIClient()
+        client.force_authenticate(self.author)
+        response = client.patch(
+            f'/api/recipes/{self.recipe.pk}/',
+            {
+                'ingredients': [
+                    {'id': self.salt.pk, 'amount': 5},
+                    {'id': self.milk.pk, 'amount': 250},
+                ],
+                'tags': [self.tag.pk],
+                'name': 'Блины',
+                'text': 'Текст',
+                'cooking_time': 15,
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertTotalsCalculated()
+
+
+class CounterTests(TestCase):
+    """Счетчики избранного, списков покупок и рецептов автора
+    обновляются вместе с данными и сверяются reconcile_counters.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author, cls.other, cls.buyer = (
+            User.objects.create_user(
+                username=name, email=f'{name}@example.com', password='pass')
+            for name in ('author', 'other', 'buyer')
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Блины', text='Текст', cooking_time=10)
+
+    def assertCounters(self, favorites, carts, author_recipes):
+        self.recipe.refresh_from_db()
+        self.author.refresh_from_db()
+        self.assertEqual(
+            (self.recipe.favorites_count, self.recipe.in_carts_count,
+             self.author.recipes_count),
+            (favorites, carts, author_recipes))
+
+    def test_counters_follow_changes(self):
+        self.assertCounters(0, 0, 1)
+        Favorite.objects.create(user=self.buyer, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.buyer, recipe=self.recipe)
+        ShoppingCart.objects.create(user=self.other, recipe=self.recipe)
+        self.assertCounters(1, 2, 1)
+        Favorite.objects.filter(user=self.buyer).delete()
+        self.assertCounters(0, 2, 1)
+        self.buyer.delete()
+        self.assertCounters(0, 1, 1)
+        Recipe.objects.create(
+            author=self.author, name='Хлеб', text='Текст', cooking_time=30)
+        self.assertCounters(0, 1, 2)
+        self.recipe.author = self.other
+        self.recipe.save()
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.recipes_count, 1)
+        self.assertCounters(0, 1, 1)
+
+    def test_counter_not_below_zero(self):
+        favorite = Favorite.objects.create(user=self.buyer, recipe=self.recipe)
+        Recipe.objects.filter(pk=self.recipe.pk).update(favorites_count=0)
+        favorite.delete()
+        self.assertCounters(0, 0, 1)
+
+    def test_reconcile(self):
+        Favorite.objects.create(user=self.buyer, recipe=self.recipe)
+        Recipe.objects.filter(pk=self.recipe.pk).update(
+            favorites_count=5, in_carts_count=3)
+        User.objects.filter(pk=self.author.pk).update(recipes_count=0)
+        self.assertEqual(reconcile_counters(), {
+            'Recipe.favorites_count': 1,
+            'Recipe.in_carts_count': 1,
+            'FoodUser.recipes_count': 1,
+        })
+        self.assertCounters(1, 0, 1)
+        output = io.StringIO()
+        call_command('reconcile_counters', stdout=output)
+        self.assertIn('Recipe.favorites_count: исправлено записей 0',
+                      output.getvalue())
+
+
+class LoadIngredientsTests(TestCase):
+    """Повторная загрузка ингредиентов не создает дублей."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.directory = directory
+
+    def write(self, name, content):
+        path = os.path.join(self.directory, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, path):
+        output = io.StringIO()
+        call_command('load_ingredients', '--path', path, '--batch-size', '2',
+                     stdout=output)
+        return output.getvalue()
+
+    def test_rerun(self):
+        csv_path = self.write(
+            'ingredients.csv',
+            'мука,г\nсоль,г\n\nмука,г\n молоко , мл\nяйцо\n')
+        self.assertIn('добавлено ингредиентов: 3', self.load(csv_path))
+        self.assertIn('добавлено ингредиентов: 0', self.load(csv_path))
+        jsonl_path = self.write('ingredients.jsonl', ''.join(
+            json.dumps({'name': name, 'measurement_unit': unit},
+                       ensure_ascii=False) + '\n'
+            for name, unit in (('соль', 'г'), ('сахар', 'г'))
+        ))
+        self.assertIn('добавлено ингредиентов: 1', self.load(jsonl_path))
+        self.assertEqual(
+            sorted(Ingredient.objects.values_list(
+                'name', 'measurement_unit')),
+            [('молоко', 'мл'), ('мука', 'г'), ('сахар', 'г'), ('соль', 'г')])
+
+
+class RecipeTransferTests(TestCase):
+    """Рецепты, выгруженные export_recipes, загружаются import_recipes
+    без изменений, битые строки пропускаются.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+        tags = [
+            Tag.objects.create(name=name, slug=slug, color=color)
+            for name, slug, color in (('Завтрак', 'breakfast', '#000000'),
+                                      ('Обед', 'lunch', '#ffffff'))
+        ]
+        flour, salt = (
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('мука', 'соль')
+        )
+        for number, amounts in enumerate(((flour, 200), (salt, 5))):
+            recipe = Recipe.objects.create(
+                author=cls.author, name=f'Рецепт {number}', text='Текст',
+                cooking_time=10 + number)
+            recipe.tags.set(tags[:number + 1])
+            RecipeIngredient.objects.create(
+                recipe=recipe, ingredient=amounts[0], amount=amounts[1])
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.path = os.path.join(directory, 'recipes.jsonl')
+
+    def exported(self):
+        call_command('export_recipes', output=self.path,
+                     stderr=io.StringIO())
+        with open(self.path, encoding='utf-8') as file:
+            return [json.loads(line) for line in file]
+
+    def test_roundtrip(self):
+        exported = self.exported()
+        Recipe.objects.all().delete()
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write('{"name": "битая строка"\n')
+            file.write('[]\n')
+            file.write(json.dumps({**exported[0], 'author': None}) + '\n')
+            record = dict(exported[0])
+            del record['author']
+            file.write(json.dumps(record) + '\n')
+        output = io.StringIO()
+        call_command('import_recipes', self.path, stdout=output)
+        self.assertIn('Загружено рецептов: 2, пропущено: 4',
+                      output.getvalue())
+        self.assertEqual(self.exported(), exported)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 2)
+
+
+class ImageReferenceTests(TestCase):
+    """Общий файл изображения удаляется вместе с последней ссылкой."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.com', password='pass')
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.content = self.image_content((4, 4))
+        self.storage = Recipe._meta.get_field('image').storage
+
+    def image_content(self, size):
+        buffer = io.BytesIO()
+        Image.new('RGB', size, 'red').save(buffer, 'PNG')
+        return buffer.getvalue()
+
+    def create_recipe(self, content=None):
+        recipe = Recipe(
+            author=self.author, name='Блины', text='Текст', cooking_time=10)
+        recipe.image = ContentFile(content or self.content, 'temp.png')
+        recipe.save()
+        return recipe
+
+    def variant_files(self, recipe):
+        recipe.refresh_from_db()
+        return [
+            name for image_format in VARIANT_FORMATS
+            for name, _ in recipe.image_variants[image_format]
+        ]
+
+    def references(self, name):
+        return ImageReference.objects.filter(name=name).values_list(
+            'references', flat=True).first()
+
+    def test_shared_file_deleted_with_last_reference(self):
+        first, second = self.create_recipe(), self.create_recipe()
+        name = first.image.name
+        self.assertEqual(second.image.name, name)
+        self.assertEqual(self.references(name), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.references(name), 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            second.delete()
+        self.assertFalse(self.storage.exists(name))
+        self.assertIsNone(self.references(name))
+
+    def test_file_deleted_while_reused_is_restored(self):
+        recipe = self.create_recipe()
+        name = recipe.image.name
+        with self.captureOnCommitCallbacks() as callbacks:
+            recipe.delete()
+        # Второй рецепт находит файл и не пишет его, затем первая
+        # транзакция удаляет файл без ссылок.
+        self.assertEqual(
+            self.storage.save('recipes/images/temp.png',
+                              ContentFile(self.content)),
+            name)
+        for callback in callbacks:
+            callback()
+        self.assertFalse(self.storage.exists(name))
+        ImageReference.objects.acquire(
+            self.storage, name, ContentFile(self.content))
+        self.assertTrue(self.storage.exists(name))
+        self.assertEqual(self.references(name), 1)
+
+    def test_variants_of_different_originals_not_shared(self):
+        # Однотонные изображения разного размера дают одинаковые копии.
+        first, second = (
+            self.create_recipe(self.image_content(size))
+            for size in ((400, 400), (800, 800))
+        )
+        for recipe in (first, second):
+            save_variants(recipe.pk, render_variants(recipe.image.name))
+        first_variants = self.variant_files(first)
+        second_variants = self.variant_files(second)
+        self.assertFalse(set(first_variants) & set(second_variants))
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        for name in first_variants:
+            self.assertFalse(self.storage.exists(name))
+        for name in second_variants:
+            self.assertTrue(self.storage.exists(name))
+
+    def test_unrecorded_variants_deleted(self):
+        recipe = self.create_recipe(self.image_content((400, 400)))
+        variants = render_variants(recipe.image.name)
+        directory = self.storage.variants_directory(recipe.image.name)
+        self.assertTrue(self.storage.exists(directory))
+        with self.captureOnCommitCallbacks(execute=True):
+            recipe.delete()
+        self.assertFalse(self.storage.exists(directory))
+        for image_format in VARIANT_FORMATS:
+            for name, _ in variants[image_format]:
+                self.assertFalse(self.storage.exists(name))
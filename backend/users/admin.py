@@ -3,6 +3,7 @@ from django.contrib.auth import get_user_model
 from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import Group
 
+from recipes.admin_tools import LargeTableAdminMixin, username_filter
 from users.models import Follow, FoodUser
 
 User = get_user_model
@@ -13,7 +14,7 @@ admin.site.unregister(Group)
 
 
 @admin.register(FoodUser)
-class FoodUserAdmin(UserAdmin):
+class FoodUserAdmin(LargeTableAdminMixin, UserAdmin):
     list_display = (
         'id',
         'username',
@@ -30,19 +31,22 @@ class FoodUserAdmin(UserAdmin):
         'username',
         'email',)
     list_filter = (
-        'username',
-        'email',)
+        'is_staff',
+        'is_active',)
 
 
 @admin.register(Follow)
-class FollowAdmin(admin.ModelAdmin):
+class FollowAdmin(LargeTableAdminMixin, admin.ModelAdmin):
     list_display = (
         'user',
         'following')
+    list_select_related = ('user', 'following')
     list_filter = (
-        'following',
-        'user'
+        username_filter('following', 'автору'),
+        username_filter('user', 'подписчику'),
     )
+    autocomplete_fields = ('user', 'following')
+    ordering = ('-id',)
     list_display_links = (
         'following',
         'user'
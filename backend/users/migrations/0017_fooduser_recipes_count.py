@@ -0,0 +1,34 @@
+# Generated by Django 4.2.9 on 2026-10-18 06:08
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def fill_recipes_count(apps, schema_editor):
+    FoodUser = apps.get_model('users', 'FoodUser')
+    Recipe = apps.get_model('recipes', 'Recipe')
+    FoodUser.objects.update(recipes_count=Coalesce(
+        models.Subquery(
+            Recipe.objects.filter(
+                author=models.OuterRef('pk')
+            ).order_by().values('author').annotate(
+                count=models.Count('pk')
+            ).values('count')
+        ), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0016_fooduser_is_subscribed'),
+        ('recipes', '0014_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='fooduser',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество рецептов'),
+        ),
+        migrations.RunPython(fill_recipes_count, migrations.RunPython.noop),
+    ]